@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+""" Module for benchmarking the redaction path
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from filtered_logger import (DETECTOR_BUDGET, PII_FIELDS, RedactingFormatter,
+                             filter_datum, get_logger,
+                             measure_detector_overhead, register_logger)
+
+
+LENGTHS = (64, 256, 1024)
+FIELD_COUNTS = (1, 5)
+SEPARATORS = (';', '|')
+DENSITIES = (0.0, 0.5, 1.0)
+FORMATTER_CONFIGS = {
+    'default': {},
+    'detect_values': {'detect_values': True},
+    'structured_kv': {'structured': 'kv'},
+    'structured_json': {'structured': 'json'},
+}
+# free text the value detector is meant for, {i} being the record number
+FREE_TEXT = (
+    'GET /api/v1/users/{i} 200 ua="Mozilla/5.0 (Windows NT 10.0; Win64; '
+    'x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.6099.130 '
+    'Safari/537.36" at 2024-01-01 12:00:{i:02d}.123 took 12.{i} ms',
+    'ValueError: invalid literal 1234{i} in module 0x7f3a2b1c9d80, '
+    'request 9876{i} from 10.0.12.254:54321 at 2024-03-05 10:11:12',
+    'user {i} logged in after a password reset and a profile update',
+    'mail sent to bob{i}@example.com, callback on 555-123-{i:04d}',
+    'name=bob{i}; email=bob{i}@example.com; ssn=123-45-6789; ip=10.0.0.1;',
+)
+RECORDS = 1000
+REPEAT = 3
+THRESHOLD = 0.10
+
+
+class NullStream:
+    """ Stream discarding everything written to it
+    """
+
+    def write(self, data: str) -> int:
+        """ Discard data
+        """
+        return len(data)
+
+    def flush(self):
+        """ Nothing to flush
+        """
+
+
+def make_pairs(length: int, n_fields: int, density: float,
+               index: int) -> List[Tuple[str, str]]:
+    """ Build the key/value pairs of a message of about length chars,
+    a density share of the keys being among the first n_fields PII fields
+    """
+    n_pairs = max(int(length // 32), 1)
+    n_pii = int(round(n_pairs * density))
+    fields = PII_FIELDS[:n_fields]
+    pairs = []
+    for i in range(n_pairs):
+        key = fields[i % len(fields)] if i < n_pii else "attr{}".format(i)
+        pairs.append((key, "v{}x{}".format(index, i).ljust(24, 'x')))
+    return pairs
+
+
+def make_fields(pairs: List[Tuple[str, str]]) -> Dict[str, str]:
+    """ Return pairs as the dict of a structured record, a repeated
+    key becoming <key>_<position> (not a PII field) so that every pair
+    is kept
+    """
+    fields = {}
+    for i, (key, value) in enumerate(pairs):
+        fields[key if key not in fields else "{}_{}".format(key, i)] = value
+    return fields
+
+
+def make_message(pairs: List[Tuple[str, str]], separator: str) -> str:
+    """ Join pairs in the field=value layout
+    """
+    return "".join("{}={}{}".format(key, value, separator)
+                   for key, value in pairs)
+
+
+def time_per_record(func: Callable, items: Sequence,
+                    repeat: int = REPEAT) -> float:
+    """ Return the best ns per item of func over repeat runs
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter_ns() - started)
+    return best / max(len(items), 1)
+
+
+def run(records: int = RECORDS, repeat: int = REPEAT) -> Dict[str, dict]:
+    """ Run every benchmark case
+    Return:
+        dict of case name to ns_per_record and records_per_s
+    """
+    results = {}
+
+    def _store(name: str, ns: float):
+        results[name] = {
+            'ns_per_record': ns,
+            'records_per_s': 1e9 / ns if ns else 0.0,
+        }
+
+    for length, n_fields, separator, density in itertools.product(
+            LENGTHS, FIELD_COUNTS, SEPARATORS, DENSITIES):
+        fields = list(PII_FIELDS[:n_fields])
+        case = "len={}/fields={}/sep={}/density={}".format(
+            length, n_fields, separator, density)
+        pairs = [make_pairs(length, n_fields, density, i)
+                 for i in range(records)]
+        messages = [make_message(p, separator) for p in pairs]
+
+        _store("filter_datum/" + case, time_per_record(
+            lambda m: filter_datum(fields, '***', m, separator),
+            messages, repeat))
+
+        formatter_class = type('RedactingFormatter', (RedactingFormatter,),
+                               {'SEPARATOR': separator})
+        for config, options in FORMATTER_CONFIGS.items():
+            formatter = formatter_class(fields, **options)
+            if options.get('structured'):
+                log_records = [logging.LogRecord("user_data", logging.INFO,
+                                                 None, None, "",
+                                                 (make_fields(p),),
+                                                 None)
+                               for p in pairs]
+            else:
+                log_records = [logging.LogRecord("user_data", logging.INFO,
+                                                 None, None, m, None, None)
+                               for m in messages]
+            _store("format/{}/{}".format(config, case),
+                   time_per_record(formatter.format, log_records, repeat))
+
+    register_logger("bench_redaction", [{'type': 'stream',
+                                         'stream': NullStream()}])
+    logger = get_logger("bench_redaction")
+    messages = [make_message(make_pairs(256, 5, 0.5, i), ';')
+                for i in range(records)]
+    _store("get_logger/call", time_per_record(
+        lambda _: get_logger("bench_redaction"), messages, repeat))
+    _store("get_logger/info", time_per_record(logger.info, messages, repeat))
+    return results
+
+
+def detector_overhead(records: int = RECORDS,
+                      repeat: int = REPEAT) -> dict:
+    """ Measure the overhead of the value detector on records lines
+    of FREE_TEXT, see measure_detector_overhead
+    """
+    messages = [FREE_TEXT[i % len(FREE_TEXT)].format(i=i % 60)
+                for i in range(records)]
+    return measure_detector_overhead(messages, repeat=repeat)
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict],
+            threshold: float = THRESHOLD) -> List[str]:
+    """ Return the cases whose ns_per_record grew by more than
+    threshold (a fraction) compared to baseline
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None or not base['ns_per_record']:
+            continue
+        change = result['ns_per_record'] / base['ns_per_record'] - 1
+        if change > threshold:
+            regressions.append("{}: {:.0f} -> {:.0f} ns (+{:.0%})".format(
+                name, base['ns_per_record'], result['ns_per_record'],
+                change))
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    """ Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark filter_datum, RedactingFormatter and "
+                    "get_logger")
+    parser.add_argument("-o", "--output", default="bench_redaction.json",
+                        help="JSON file receiving the results")
+    parser.add_argument("-b", "--baseline",
+                        help="JSON results of a previous run to compare to")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD,
+                        help="allowed slowdown against the baseline, "
+                             "as a fraction")
+    parser.add_argument("-n", "--records", type=int, default=RECORDS)
+    parser.add_argument("-r", "--repeat", type=int, default=REPEAT)
+    args = parser.parse_args(argv)
+    baseline = None
+    if args.baseline is not None:
+        if os.path.abspath(args.baseline) == os.path.abspath(args.output):
+            parser.error("--output would overwrite the baseline {}".format(
+                args.baseline))
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+
+    results = run(args.records, args.repeat)
+    for name, result in sorted(results.items()):
+        print("{:<70} {:>10.0f} ns/record {:>12.0f} records/s".format(
+            name, result['ns_per_record'], result['records_per_s']))
+    overhead = detector_overhead(args.records, args.repeat)
+    print("detector overhead on free text: {:.0%} (budget {:.0%})".format(
+        overhead['overhead'], DETECTOR_BUDGET))
+    with open(args.output, 'w') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'results': results,
+            'detector_overhead': overhead,
+        }, f, indent=2)
+
+    failed = not overhead['within_budget']
+    if failed:
+        print("OVER BUDGET detector overhead {:.0%} > {:.0%}".format(
+            overhead['overhead'], DETECTOR_BUDGET), file=sys.stderr)
+    if baseline is None:
+        return 1 if failed else 0
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print("REGRESSION " + regression, file=sys.stderr)
+    return 1 if regressions or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
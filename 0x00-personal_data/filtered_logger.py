@@ -2,14 +2,74 @@
 """ Module for the definition of filter_datum function
 """
 
+import atexit
 import logging
-from typing import List
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from collections import OrderedDict
+from functools import lru_cache
+from operator import attrgetter
+from typing import Callable, Iterator, List, Mapping, Sequence, Tuple
+import json
+import os
+import queue
 import re
+import string
+import sys
+import threading
+import time
 
 
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
 
+ENGINE_CACHE_SIZE = 128
+FORMAT_KEY = re.compile(r'%\((\w+)\)')
+
+
+class RedactionEngine:
+    """ Redaction engine compiling a set of fields and a separator
+    into a single alternation pattern, so each message is scanned once
+    """
+
+    def __init__(self, fields: Tuple[str, ...], separator: str):
+        """ Compile the pattern for fields and separator
+        Parameters:
+            fields: tuple of field names to obfuscate
+            separator: character separating all fields
+        """
+        self.fields = tuple(fields)
+        self.separator = separator
+        self.pattern = None
+        if self.fields:
+            alternation = '|'.join(re.escape(f) for f in self.fields)
+            self.pattern = re.compile('({})=.*?{}'.format(
+                alternation, re.escape(separator)))
+
+    def redact(self, message: str, redaction: str) -> str:
+        """ Return message with the value of every field replaced
+        by redaction, in a single pass
+        """
+        if self.pattern is None:
+            return message
+        tail = '=' + redaction + self.separator
+        return self.pattern.sub(lambda m: m.group(1) + tail, message)
+
+
+@lru_cache(maxsize=ENGINE_CACHE_SIZE)
+def _cached_engine(fields: Tuple[str, ...],
+                   separator: str) -> RedactionEngine:
+    """ Build (once) the engine for a (fields, separator) key
+    """
+    return RedactionEngine(fields, separator)
+
+
+def get_engine(fields: Sequence[str], separator: str) -> RedactionEngine:
+    """ Return the compiled engine for fields and separator,
+    served from a bounded LRU cache
+    """
+    return _cached_engine(tuple(fields), separator)
+
+
 def filter_datum(fields: List[str], redaction: str,
                  message: str, separator: str) -> str:
     """ Function that return the log message obfuscated
@@ -19,10 +79,129 @@ def filter_datum(fields: List[str], redaction: str,
         message: log message to be in the log line
         separator: character separating all fields
     """
-    for field in fields:
-        message = re.sub(field+'=.*?'+separator,
-                         field+'='+redaction+separator, message)
-    return message
+    return get_engine(fields, separator).redact(message, redaction)
+
+
+# the domain of an email, or a run of digits, ( ) . - and single spaces
+# followed by a digit or (, holding at least the 9 digits of the
+# shortest value (an SSN): it never ends on a space, so the classifier
+# sees the next word. Starting with a character set lets the regex
+# engine skip to the next @, ( or digit; a digit following a digit is
+# rejected first (the run was tried from its first digit), then runs
+# shorter than any value, before the costlier count of the digits
+MIN_DIGITS = r'(?=(?:[() .-]{0,2}[0-9]){8})'
+SCANNER_PATTERN = (r'[@(0-9](?:(?<=@)[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)+'
+                   r'|(?<![0-9]{2})(?=[0-9() .-]{9})'
+                   r'(?:(?<=\()[0-9]|(?<=[0-9])){}'
+                   r'(?:[0-9().-]| (?=[0-9(]))*)').replace('{}', MIN_DIGITS)
+NUMBER_PATTERNS = (
+    ('ssn', r'\b[0-9]{3}-[0-9]{2}-[0-9]{4}\b'),
+    ('card', r'\b[0-9](?:[ -]?[0-9]){12,18}\b'),
+    ('phone', r'(?:[0-9]{1,3}[ .-]?)?\(?[0-9]{3}\)?[ .-]?[0-9]{3}[ .-]?'
+              r'[0-9]{4}\b'),
+)
+# values must not be glued to a word, nor be the local part of an email;
+# the shortest (a phone number without separators) has 10 characters
+CLASSIFIER_PATTERN = r'(?<!\w)(?=[0-9() .-]{10})(?:{})(?![\w@])'
+LOCAL_PART_CHARS = frozenset(string.ascii_letters + string.digits + '._+-')
+# maximum extra cost of the detector relative to RedactingFormatter.format,
+# on free text (user agents, tracebacks, sentences): checked by
+# bench_redaction.py
+DETECTOR_BUDGET = 2.0
+
+
+def luhn_valid(number: str) -> bool:
+    """ Return True if the digits of number pass the Luhn checksum
+    """
+    digits = [int(c) for c in number if c.isdigit()]
+    checksum = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        checksum += digit
+    return checksum % 10 == 0
+
+
+class ValueDetector:
+    """ Detector of PII values (email, phone, SSN, credit card) in
+    free text. A single scanner finds the domain part of emails and
+    runs of digits; only these rare candidates are then extended to the
+    email local part or classified as SSN, card or phone
+    """
+
+    def __init__(self):
+        """ Compile the scanner and the classifier of digit runs
+        """
+        self.scanner = re.compile(SCANNER_PATTERN)
+        self.classifier = re.compile(CLASSIFIER_PATTERN.replace(
+            '{}', '|'.join('(?P<{}>{})'.format(kind, regex)
+                           for kind, regex in NUMBER_PATTERNS)))
+
+    def spans(self, message: str) -> Iterator[Tuple[int, int, str]]:
+        """ Yield the (start, end, kind) of every value detected in
+        message, in order
+        """
+        pos = 0
+        for match in self.scanner.finditer(message):
+            start, end = match.span()
+            if message[start] == '@':
+                while start > pos and message[start - 1] in LOCAL_PART_CHARS:
+                    start -= 1
+                if start < match.start():
+                    yield start, end, 'email'
+                pos = end
+                continue
+            # classified in place, so that the word boundaries see the
+            # characters around the run (and one past it, no more)
+            found = False
+            for number in self.classifier.finditer(
+                    message, start, min(end + 1, len(message))):
+                if number.start() >= end:
+                    break
+                if number.lastgroup == 'card' and \
+                        not luhn_valid(number.group()):
+                    continue
+                found = True
+                yield number.start(), number.end(), number.lastgroup
+            if found:
+                pos = end
+
+    def redact(self, message: str, redaction: str) -> str:
+        """ Return message with every detected value replaced by
+        redaction, in a single pass
+        """
+        pieces = []
+        last = 0
+        for start, end, _ in self.spans(message):
+            pieces.append(message[last:start])
+            pieces.append(redaction)
+            last = end
+        if not pieces:
+            return message
+        pieces.append(message[last:])
+        return "".join(pieces)
+
+    def findall(self, message: str) -> List[Tuple[str, str]]:
+        """ Return the (kind, value) pairs detected in message
+        """
+        return [(kind, message[start:end])
+                for start, end, kind in self.spans(message)]
+
+
+def compile_format(fmt: str) -> Tuple[str, Callable]:
+    """ Compile a %-style logging format into a positional template
+    and a getter returning the record attributes it uses, in order
+    """
+    keys = FORMAT_KEY.findall(fmt)
+    template = FORMAT_KEY.sub('%', fmt)
+    if not keys:
+        return template, lambda record: ()
+    if len(keys) == 1:
+        getter = attrgetter(keys[0])
+        return template, lambda record: (getter(record),)
+    return template, attrgetter(*keys)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -33,9 +212,33 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    STRUCTURED_MODES = ('kv', 'json')
+    STRUCTURED_KEY = "data"
+
+    def __init__(self, fields: List[str], structured: str = None,
+                 detect_values: bool = False):
+        """ Initialize the formatter
+        Args:
+            fields: fields to obfuscate
+            structured: None, 'kv' or 'json'. In structured mode a dict
+                passed as extra={'data': ...} or as the only logging
+                argument is redacted by key before any string is built
+            detect_values: if True, also obfuscate emails, phone numbers,
+                SSNs and credit card numbers found anywhere in the line
+        """
+        if structured is not None and \
+                structured not in self.STRUCTURED_MODES:
+            raise ValueError("structured must be one of {}".format(
+                ", ".join(self.STRUCTURED_MODES)))
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.structured = structured
+        self._field_set = frozenset(fields)
+        self._engine = get_engine(fields, self.SEPARATOR)
+        self._detector = ValueDetector() if detect_values else None
+        self._template, self._record_values = compile_format(self.FORMAT)
+        self._uses_time = self._style.usesTime()
+        self._time_cache = (None, None)
 
     def format(self, record: logging.LogRecord) -> str:
         """ The message of LogRecord instance
@@ -44,23 +247,647 @@ class RedactingFormatter(logging.Formatter):
         Return:
             formatted string
         """
+        if self.structured is not None:
+            data = getattr(record, self.STRUCTURED_KEY, None)
+            if not isinstance(data, Mapping):
+                data = record.args if isinstance(record.args, Mapping) \
+                    else None
+            if data is not None:
+                return self.format_structured(record, data)
         message = super(RedactingFormatter, self).format(record)
-        redacted = filter_datum(self.fields, self.REDACTION,
-                                message, self.SEPARATOR)
-        return redacted
+        if self._detector is None or record.exc_text or record.stack_info:
+            message = self._engine.redact(message, self.REDACTION)
+        if self._detector is not None and \
+                (record.exc_text or record.stack_info):
+            message = self._detector.redact(message, self.REDACTION)
+        return message
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        """ With the value detector, redact the message alone (by key,
+        then by value) before building the line: the prefix built from
+        FORMAT carries no PII
+        """
+        if self._detector is not None:
+            record.message = self._detector.redact(
+                self._engine.redact(record.message, self.REDACTION),
+                self.REDACTION)
+        return self._template % self._record_values(record)
+
+    def usesTime(self) -> bool:
+        """ Whether FORMAT uses asctime, computed once in __init__
+        """
+        return self._uses_time
+
+    def formatTime(self, record: logging.LogRecord,
+                   datefmt: str = None) -> str:
+        """ Format the creation time of record, the part up to the
+        second being cached so only the milliseconds are rebuilt
+        """
+        if datefmt is not None or self.default_msec_format is None:
+            return super(RedactingFormatter, self).formatTime(record,
+                                                              datefmt)
+        second = int(record.created)
+        cached = self._time_cache
+        if cached[0] != second:
+            cached = (second, time.strftime(self.default_time_format,
+                                            self.converter(second)))
+            self._time_cache = cached
+        return self.default_msec_format % (cached[1], record.msecs)
+
+    def format_structured(self, record: logging.LogRecord,
+                          data: Mapping) -> str:
+        """ Format a record carrying a dict of fields as a key=value;
+        line or a JSON line (the fields under STRUCTURED_KEY), replacing
+        PII values by key. Only a free text message passed alongside
+        extra=, the traceback and the stack still go through the regex
+        engine
+        Args:
+            record (logging.LogRecord): LogRecord instance
+            data: the fields of the record
+        Return:
+            formatted string
+        """
+        redacted = {
+            key: self.REDACTION if key in self._field_set else value
+            for key, value in data.items()
+        }
+        if self._detector is not None:
+            for key, value in redacted.items():
+                if isinstance(value, str) and key not in self._field_set:
+                    redacted[key] = self._detector.redact(value,
+                                                          self.REDACTION)
+        if data is record.args:
+            text = str(record.msg) % redacted
+        else:
+            text = self._redact_text(record.getMessage())
+        exc_text = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            exc_text = self._redact_text(record.exc_text)
+        stack_info = None
+        if record.stack_info:
+            stack_info = self._redact_text(self.formatStack(
+                record.stack_info))
+        asctime = self.formatTime(record, self.datefmt)
+
+        if self.structured == 'json':
+            line = {
+                'asctime': asctime,
+                'logger': record.name,
+                'level': record.levelname,
+                'message': text,
+                self.STRUCTURED_KEY: redacted,
+            }
+            if exc_text:
+                line['exc_text'] = exc_text
+            if stack_info:
+                line['stack_info'] = stack_info
+            return json.dumps(line, default=str)
+
+        pairs = "".join("{}={}{}".format(key, value, self.SEPARATOR)
+                        for key, value in redacted.items())
+        record.asctime = asctime
+        record.message = "{} {}".format(text, pairs) if text else pairs
+        line = self._template % self._record_values(record)
+        if exc_text:
+            line = "{}\n{}".format(line, exc_text)
+        if stack_info:
+            line = "{}\n{}".format(line, stack_info)
+        return line
+
+    def _redact_text(self, text: str) -> str:
+        """ Redact free text by key, then by value with the detector
+        """
+        text = self._engine.redact(text, self.REDACTION)
+        if self._detector is not None:
+            text = self._detector.redact(text, self.REDACTION)
+        return text
+
 
-def get_logger() -> logging.Logger:
+def measure_detector_overhead(messages: Sequence[str],
+                              fields: Sequence[str] = PII_FIELDS,
+                              repeat: int = 5) -> dict:
+    """ Measure the cost per record of RedactingFormatter.format with
+    and without the value detector on messages
+    Return:
+        dict with base_ns, detector_ns, overhead (relative extra cost)
+        and within_budget, overhead being compared to DETECTOR_BUDGET
     """
-    Function that return a logging.Logger object
+    records = [logging.LogRecord("user_data", logging.INFO, None, None,
+                                 message, None, None)
+               for message in messages]
+    base = RedactingFormatter(fields)
+    detecting = RedactingFormatter(fields, detect_values=True)
+    best = {}
+    for name, formatter in (('base', base), ('detector', detecting)):
+        best[name] = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for record in records:
+                formatter.format(record)
+            best[name] = min(best[name], time.perf_counter_ns() - started)
+    count = max(len(records), 1)
+    overhead = (best['detector'] - best['base']) / best['base'] \
+        if best['base'] else 0.0
+    return {
+        'base_ns': best['base'] / count,
+        'detector_ns': best['detector'] / count,
+        'overhead': overhead,
+        'within_budget': overhead <= DETECTOR_BUDGET,
+    }
+
+
+OVERFLOW_POLICIES = ('block', 'drop-oldest', 'drop-newest')
+ASYNC_QUEUE_SIZE = 10000
+
+
+class AsyncQueueHandler(QueueHandler):
+    """ QueueHandler pushing raw records onto a bounded queue,
+    applying an overflow policy when the queue is full. Whatever the
+    policy, every record handled is counted once: as enqueued while it
+    is in the queue or once flushed, or as dropped if it was refused or
+    evicted
+    """
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = 'block'):
+        """ Initialize the handler
+        Parameters:
+            log_queue: bounded queue shared with the listener
+            overflow: one of OVERFLOW_POLICIES
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ", ".join(OVERFLOW_POLICIES)))
+        super(AsyncQueueHandler, self).__init__(log_queue)
+        self.overflow = overflow
+        self.listener = None
+        self.stats = {'enqueued': 0, 'dropped': 0, 'flushed': 0}
+        self._stats_lock = threading.Lock()
+
+    def count(self, key: str, n: int = 1):
+        """ Increment one of the counters in stats
+        """
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ Leave the record untouched: formatting and redaction
+        are done by the listener thread
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        """ Put record on the queue according to the overflow policy
+        """
+        if self.overflow == 'block':
+            self.queue.put(record)
+        elif self.overflow == 'drop-newest':
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.count('dropped')
+                return
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(record)
+                    break
+                except queue.Full:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        continue
+                    with self._stats_lock:
+                        self.stats['enqueued'] -= 1
+                        self.stats['dropped'] += 1
+        self.count('enqueued')
+
+    def close(self):
+        """ Stop the listener (flushing pending records) and close
+        """
+        if self.listener is not None:
+            self.listener.stop()
+        super(AsyncQueueHandler, self).close()
+
+
+class AsyncQueueListener(QueueListener):
+    """ QueueListener formatting and writing records on its own
+    thread, counting flushed records on the queue handler
     """
-    logger = logging.getLogger("user_data")
-    logger.setLevel(logging.INFO)
+
+    def __init__(self, queue_handler: AsyncQueueHandler,
+                 *handlers: logging.Handler):
+        """ Initialize the listener for queue_handler
+        """
+        super(AsyncQueueListener, self).__init__(
+            queue_handler.queue, *handlers, respect_handler_level=True)
+        self.queue_handler = queue_handler
+        queue_handler.listener = self
+
+    def handle(self, record: logging.LogRecord):
+        """ Dispatch record to the handlers and count it as flushed
+        """
+        super(AsyncQueueListener, self).handle(record)
+        self.queue_handler.count('flushed')
+
+    def enqueue_sentinel(self):
+        """ Block until the sentinel fits, so a full queue is drained
+        instead of raising on stop
+        """
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        """ Flush pending records and stop the thread, once
+        """
+        if self._thread is not None:
+            super(AsyncQueueListener, self).stop()
+
+
+SUPPRESSION_KEYS = 10000
+SUMMARY_INTERVAL = 60.0
+
+
+class RateLimitingFilter(logging.Filter):
+    """ Filter sampling and rate limiting records per logger name and
+    message template, so that bursts of identical records (failed
+    logins...) do not all pay for redaction and I/O
+    """
+
+    SUMMARY_FORMAT = "%d similar records suppressed: %s"
+
+    def __init__(self, sample_rate: int = 1, rate: float = None,
+                 burst: int = None,
+                 summary_interval: float = SUMMARY_INTERVAL):
+        """ Initialize the filter
+        Parameters:
+            sample_rate: let 1 record out of sample_rate through per key
+            rate: records per second allowed per key (token bucket),
+                None for no rate limit
+            burst: size of the token bucket, rate by default
+            summary_interval: seconds between two "N similar records
+                suppressed" summaries, emitted by a background thread
+                started at the first suppressed record and at exit
+        """
+        super(RateLimitingFilter, self).__init__()
+        if sample_rate < 1:
+            raise ValueError("sample_rate must be at least 1")
+        self.sample_rate = sample_rate
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate or 1, 1)
+        self.summary_interval = summary_interval
+        self.suppressed_total = 0
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._timer = None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """ Return True if record should be emitted
+        """
+        if getattr(record, 'suppression_summary', False):
+            return True
+        # the message template, or its text when it is not a string
+        # (and maybe not hashable, e.g. logger.info({'a': 1}))
+        msg = record.msg if isinstance(record.msg, str) else str(record.msg)
+        key = (record.name, msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = {
+                    'seen': 0, 'tokens': self.burst, 'updated': now,
+                    'suppressed': 0, 'levelno': record.levelno,
+                }
+                if len(self._keys) > SUPPRESSION_KEYS:
+                    self._keys.popitem(last=False)
+            else:
+                self._keys.move_to_end(key)
+            allowed = state['seen'] % self.sample_rate == 0
+            state['seen'] += 1
+            if allowed and self.rate is not None:
+                state['tokens'] = min(
+                    self.burst,
+                    state['tokens'] + (now - state['updated']) * self.rate)
+                state['updated'] = now
+                if state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                else:
+                    allowed = False
+            if not allowed:
+                state['suppressed'] += 1
+                state['levelno'] = record.levelno
+                self.suppressed_total += 1
+                if self._timer is None:
+                    self._start_timer()
+        return allowed
+
+    def _start_timer(self):
+        """ Start the thread emitting the summaries every
+        summary_interval seconds and flush them at exit, must be called
+        with the lock held
+        """
+        self._timer = threading.Thread(target=self._run_timer, daemon=True)
+        self._timer.start()
+        atexit.register(self.flush_summary)
+
+    def _run_timer(self):
+        """ Background loop emitting the summaries until stopped
+        """
+        while not self._stopping.wait(self.summary_interval):
+            self.flush_summary()
+
+    def _collect_summaries(self) -> list:
+        """ Return and reset the suppressed counters, must be called
+        with the lock held
+        """
+        summaries = []
+        for (name, msg), state in self._keys.items():
+            if state['suppressed']:
+                summaries.append((name, msg, state['levelno'],
+                                  state['suppressed']))
+                state['suppressed'] = 0
+        return summaries
+
+    def _emit_summaries(self, summaries: list):
+        """ Log one summary record per suppressed key
+        """
+        for name, msg, levelno, count in summaries:
+            logger = logging.getLogger(name)
+            record = logger.makeRecord(name, levelno, "(suppressed)", 0,
+                                       self.SUMMARY_FORMAT, (count, msg),
+                                       None)
+            record.suppression_summary = True
+            logger.handle(record)
+
+    def flush_summary(self):
+        """ Emit the pending summaries now
+        """
+        with self._lock:
+            summaries = self._collect_summaries()
+        self._emit_summaries(summaries)
+
+    def stop(self):
+        """ Stop the background thread and emit the pending summaries
+        """
+        self._stopping.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush_summary()
+
+
+DEFAULT_SINKS = ({'type': 'stream', 'fields': PII_FIELDS},)
+SINK_TYPES = ('stream', 'file', 'rotating_file')
+
+_LOGGER_CONFIGS = {}
+_LOGGERS = {}
+_HANDLERS = {}
+_FORMATTERS = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def register_logger(name: str, sinks: Sequence[dict] = DEFAULT_SINKS,
+                    level: int = logging.INFO, async_mode: bool = False,
+                    queue_size: int = ASYNC_QUEUE_SIZE,
+                    overflow: str = 'block',
+                    filters: Sequence[logging.Filter] = ()):
+    """ Register the configuration of a logger, built on first use
+    Parameters:
+        name: name of the logger
+        sinks: list of dicts with a 'type' in SINK_TYPES, the 'fields'
+            to redact, an optional 'structured' mode ('kv' or 'json'),
+            an optional 'detect_values' flag and, for files, a
+            'filename' ('max_bytes' and 'backup_count' for rotating
+            files, optional 'level')
+        level: level of the logger
+        async_mode: if True, redaction and I/O run on a background thread
+        queue_size: maximum number of pending records in async mode
+        overflow: policy when the queue is full, one of OVERFLOW_POLICIES
+        filters: filters (e.g. RateLimitingFilter) run before any
+            record reaches the handlers
+    """
+    for sink in sinks:
+        if sink.get('type') not in SINK_TYPES:
+            raise ValueError("sink type must be one of {}".format(
+                ", ".join(SINK_TYPES)))
+        if sink['type'] != 'stream' and sink.get('filename') is None:
+            raise ValueError("{} sink requires a filename".format(
+                sink['type']))
+    with _REGISTRY_LOCK:
+        _LOGGER_CONFIGS[name] = {
+            'sinks': tuple(dict(sink) for sink in sinks),
+            'level': level,
+            'async_mode': async_mode,
+            'queue_size': queue_size,
+            'overflow': overflow,
+            'filters': tuple(filters),
+        }
+        logger = _LOGGERS.pop(name, None)
+        if logger is not None:
+            for log_filter in list(logger.filters):
+                logger.removeFilter(log_filter)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                if isinstance(handler, AsyncQueueHandler):
+                    handler.close()
+
+
+def _get_formatter(fields: Sequence[str], structured: str = None,
+                   detect_values: bool = False) -> RedactingFormatter:
+    """ Return the shared formatter for a set of fields and options
+    """
+    key = (tuple(fields), structured, detect_values)
+    formatter = _FORMATTERS.get(key)
+    if formatter is None:
+        formatter = RedactingFormatter(key[0], structured, detect_values)
+        _FORMATTERS[key] = formatter
+    return formatter
+
+
+def _get_handler(sink: dict) -> logging.Handler:
+    """ Return the shared handler for a sink configuration
+    """
+    fields = tuple(sink.get('fields', PII_FIELDS))
+    options = (sink.get('structured'), bool(sink.get('detect_values')))
+    if sink['type'] == 'stream':
+        stream = sink.get('stream', sys.stderr)
+        key = ('stream', id(stream), fields) + options
+    else:
+        key = (sink['type'], os.path.abspath(sink['filename']),
+               fields) + options
+    handler = _HANDLERS.get(key)
+    if handler is None:
+        if sink['type'] == 'stream':
+            handler = logging.StreamHandler(stream)
+        elif sink['type'] == 'file':
+            handler = logging.FileHandler(sink['filename'])
+        else:
+            handler = RotatingFileHandler(
+                sink['filename'], maxBytes=sink.get('max_bytes', 0),
+                backupCount=sink.get('backup_count', 0))
+        handler.setFormatter(_get_formatter(fields, *options))
+        _HANDLERS[key] = handler
+    if sink.get('level') is not None:
+        handler.setLevel(sink['level'])
+    return handler
+
+
+def _build_logger(name: str, config: dict) -> logging.Logger:
+    """ Attach the handlers described by config to the named logger
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(config['level'])
     logger.propagate = False
 
-    handler = logging.StreamHandler()
+    handlers = [_get_handler(sink) for sink in config['sinks']]
+    if config['async_mode']:
+        queue_handler = AsyncQueueHandler(queue.Queue(config['queue_size']),
+                                          config['overflow'])
+        listener = AsyncQueueListener(queue_handler, *handlers)
+        listener.start()
+        atexit.register(listener.stop)
+        handlers = [queue_handler]
+    for handler in handlers:
+        logger.addHandler(handler)
+    for log_filter in config.get('filters', ()):
+        logger.addFilter(log_filter)
+    return logger
 
-    formatter = RedactingFormatter(PII_FIELDS)
 
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+def get_logger(name: str = "user_data", async_mode: bool = False,
+               queue_size: int = ASYNC_QUEUE_SIZE,
+               overflow: str = 'block') -> logging.Logger:
+    """
+    Function that return a logging.Logger object, built once per name
+    Parameters:
+        name: name of the logger, configured with register_logger or
+            defaulting to a stream sink redacting PII_FIELDS
+        async_mode: if True, redaction and I/O run on a background thread
+        queue_size: maximum number of pending records in async mode
+        overflow: policy when the queue is full, one of OVERFLOW_POLICIES
+    The async options are only used if name was not registered and
+    are ignored once the logger has been built.
+    """
+    logger = _LOGGERS.get(name)
+    if logger is not None:
+        return logger
+    with _REGISTRY_LOCK:
+        logger = _LOGGERS.get(name)
+        if logger is None:
+            config = _LOGGER_CONFIGS.get(name)
+            if config is None:
+                config = {
+                    'sinks': DEFAULT_SINKS,
+                    'level': logging.INFO,
+                    'async_mode': async_mode,
+                    'queue_size': queue_size,
+                    'overflow': overflow,
+                }
+            logger = _build_logger(name, config)
+            _LOGGERS[name] = logger
     return logger
+
+
+def get_logger_stats(logger: logging.Logger) -> dict:
+    """ Return enqueued, dropped and flushed counters summed over
+    the async handlers of logger: enqueued + dropped is the number of
+    records handled, enqueued - flushed the number still pending
+    """
+    stats = {'enqueued': 0, 'dropped': 0, 'flushed': 0}
+    for handler in logger.handlers:
+        if isinstance(handler, AsyncQueueHandler):
+            for key, value in handler.stats.items():
+                stats[key] += value
+    return stats
+
+
+EXPORT_BATCH_SIZE = 1000
+MYSQL_DB_NAME = "holberton"
+SQLITE_DB_PATH = "personal_data.sqlite"
+IDENTIFIER = re.compile(r'^[A-Za-z_]\w*$')
+
+
+def get_db():
+    """
+    Function that return a connection to the database: the MySQL
+    database PERSONAL_DATA_DB_NAME when PERSONAL_DATA_DB_HOST is set and
+    mysql-connector is installed, otherwise the SQLite file
+    PERSONAL_DATA_DB_PATH
+    """
+    host = os.getenv("PERSONAL_DATA_DB_HOST")
+    if host is not None:
+        try:
+            import mysql.connector
+        except ImportError:
+            mysql = None
+        if mysql is not None:
+            return mysql.connector.connection.MySQLConnection(
+                user=os.getenv("PERSONAL_DATA_DB_USERNAME", "root"),
+                password=os.getenv("PERSONAL_DATA_DB_PASSWORD", ""),
+                host=host,
+                database=os.getenv("PERSONAL_DATA_DB_NAME", MYSQL_DB_NAME))
+    import sqlite3
+    return sqlite3.connect(os.getenv("PERSONAL_DATA_DB_PATH",
+                                     SQLITE_DB_PATH))
+
+
+def export_users(connection, logger: logging.Logger = None,
+                 table: str = "users",
+                 batch_size: int = EXPORT_BATCH_SIZE) -> dict:
+    """ Stream every row of table through the redacting logger
+    Parameters:
+        connection: DB-API connection
+        logger: logger receiving one field=value; record per row,
+            get_logger() by default
+        table: name of the table to export
+        batch_size: number of rows fetched at once
+    Return:
+        dict with the number of rows, the duration and rows per second
+    """
+    if not IDENTIFIER.match(table):
+        raise ValueError("invalid table name: {}".format(table))
+    if logger is None:
+        logger = get_logger()
+    separator = RedactingFormatter.SEPARATOR
+    started = time.perf_counter()
+    rows = 0
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT * FROM {};".format(table))
+        columns = [column[0] for column in cursor.description]
+        template = "".join("{}=%s{}".format(column.replace('%', '%%'),
+                                            separator)
+                           for column in columns)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            for row in batch:
+                logger.info(template, *row)
+            rows += len(batch)
+    finally:
+        cursor.close()
+    seconds = time.perf_counter() - started
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds if seconds else 0.0,
+    }
+
+
+def main():
+    """
+    Function that exports the users table through the redacting logger
+    """
+    db = get_db()
+    try:
+        stats = export_users(db)
+    finally:
+        db.close()
+    print("{} rows in {:.2f}s: {:.0f} rows/s".format(
+        stats['rows'], stats['seconds'], stats['rows_per_second']),
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
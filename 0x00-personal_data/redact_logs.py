@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+""" Module for the bulk redaction of log files
+"""
+
+import argparse
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_engine
+
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def redact_lines(lines: Iterable[str],
+                 fields: Sequence[str] = PII_FIELDS,
+                 redaction: str = RedactingFormatter.REDACTION,
+                 separator: str = RedactingFormatter.SEPARATOR
+                 ) -> Iterator[str]:
+    """ Generator yielding every line of lines obfuscated
+    Parameters:
+        lines: iterable of log lines
+        fields: fields to obfuscate
+        redaction: string by what the fields will be obfuscated
+        separator: character separating all fields
+    """
+    engine = get_engine(fields, separator)
+    for line in lines:
+        yield engine.redact(line, redaction)
+
+
+def chunk_offsets(file_path: str,
+                  chunk_size: int = CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """ Split a file into (start, end) chunks ending on a line boundary
+    Parameters:
+        file_path: path of the file
+        chunk_size: approximate size of a chunk in bytes
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return []
+    offsets = []
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start < size:
+                end = mm.find(b'\n', min(start + chunk_size, size) - 1)
+                end = size if end == -1 else end + 1
+                offsets.append((start, end))
+                start = end
+    return offsets
+
+
+def redact_chunk(file_path: str, start: int, end: int,
+                 fields: Tuple[str, ...], redaction: str,
+                 separator: str) -> bytes:
+    """ Read the bytes [start, end) of a file and return them obfuscated
+    """
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = mm[start:end].decode('utf-8', errors='surrogateescape')
+    redacted = get_engine(fields, separator).redact(text, redaction)
+    return redacted.encode('utf-8', errors='surrogateescape')
+
+
+def redact_file(file_path: str, output, fields: Sequence[str] = PII_FIELDS,
+                redaction: str = RedactingFormatter.REDACTION,
+                separator: str = RedactingFormatter.SEPARATOR,
+                chunk_size: int = CHUNK_SIZE, workers: int = None) -> int:
+    """ Redact a file chunk by chunk in a process pool, writing the
+    chunks in order to the binary stream output
+    Parameters:
+        file_path: path of the file to redact
+        output: binary stream receiving the redacted content
+        fields, redaction, separator: as in filter_datum
+        chunk_size: approximate size of a chunk in bytes
+        workers: number of processes, os.cpu_count() by default
+    Return:
+        number of bytes read
+    """
+    fields = tuple(fields)
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    total = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start, end in chunk_offsets(file_path, chunk_size):
+            if len(pending) >= 2 * workers:
+                output.write(pending.popleft().result())
+            pending.append(executor.submit(redact_chunk, file_path, start,
+                                           end, fields, redaction,
+                                           separator))
+            total += end - start
+        while pending:
+            output.write(pending.popleft().result())
+    return total
+
+
+def main(argv: List[str] = None):
+    """ Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Redact PII fields from a log file")
+    parser.add_argument("input", help="log file to redact")
+    parser.add_argument("-o", "--output",
+                        help="output file (standard output by default)")
+    parser.add_argument("-f", "--fields", nargs="+", default=PII_FIELDS,
+                        help="fields to obfuscate")
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION)
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR)
+    parser.add_argument("-c", "--chunk-size", type=int,
+                        default=CHUNK_SIZE // (1024 * 1024),
+                        help="chunk size in MB")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="number of processes")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.output is None:
+        total = redact_file(args.input, sys.stdout.buffer, args.fields,
+                            args.redaction, args.separator,
+                            args.chunk_size * 1024 * 1024, args.workers)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, 'wb') as output:
+            total = redact_file(args.input, output, args.fields,
+                                args.redaction, args.separator,
+                                args.chunk_size * 1024 * 1024, args.workers)
+    elapsed = time.perf_counter() - started
+    mb = total / (1024 * 1024)
+    print("{:.1f} MB in {:.2f}s: {:.1f} MB/s".format(
+        mb, elapsed, mb / elapsed if elapsed else 0.0), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+""" Tests of filtered_logger
+"""
+import io
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from filtered_logger import (PII_FIELDS, AsyncQueueHandler,
+                             AsyncQueueListener, RateLimitingFilter,
+                             RedactingFormatter, ValueDetector, export_users,
+                             filter_datum, get_db, get_logger,
+                             register_logger)
+
+
+def filter_datum_per_field(fields: list, redaction: str, message: str,
+                           separator: str) -> str:
+    """ The original filter_datum: one re.sub per field
+    """
+    for field in fields:
+        message = re.sub(field + '=.*?' + separator,
+                         field + '=' + redaction + separator, message)
+    return message
+
+
+class TestFilterDatum(unittest.TestCase):
+    """ The single pass engine against the original per-field loop
+    """
+
+    def test_same_as_per_field(self):
+        """ Random messages give the same result
+        """
+        rng = random.Random(0)
+        keys = PII_FIELDS + ('username', 'ip', 'date', '')
+        values = ('', 'bob', 'a=b', 'x y', '***', 'name', '12')
+        for _ in range(5000):
+            separator = rng.choice(';,')
+            fields = rng.sample(PII_FIELDS, rng.randint(0, len(PII_FIELDS)))
+            message = "".join("{}={}{}".format(
+                rng.choice(keys), rng.choice(values),
+                separator if rng.random() < 0.9 else '')
+                for _ in range(rng.randint(0, 8)))
+            self.assertEqual(
+                filter_datum(fields, 'xxx', message, separator),
+                filter_datum_per_field(fields, 'xxx', message, separator),
+                (fields, message, separator))
+
+
+class TestFormatTime(unittest.TestCase):
+    """ The cached formatTime against logging.Formatter.formatTime
+    """
+
+    def test_same_as_logging(self):
+        """ Records within and across seconds give the same time and
+        line
+        """
+        formatter = RedactingFormatter(list(PII_FIELDS))
+        reference = logging.Formatter(RedactingFormatter.FORMAT)
+        rng = random.Random(0)
+        created = 1700000000.0
+        for _ in range(2000):
+            created += rng.choice((0.0004, 0.25, 0.9996, 1, 3600.5))
+            record = logging.LogRecord('test', logging.INFO, None, None,
+                                       'x', None, None)
+            record.created = created
+            record.msecs = (created - int(created)) * 1000
+            self.assertEqual(formatter.formatTime(record),
+                             reference.formatTime(record))
+            self.assertEqual(formatter.formatTime(record, "%H:%M"),
+                             reference.formatTime(record, "%H:%M"))
+            self.assertEqual(formatter.format(record),
+                             reference.format(record))
+
+
+class TestValueDetector(unittest.TestCase):
+    """ PII values detected anywhere in a message
+    """
+
+    def setUp(self):
+        """ Build the detector
+        """
+        self.detector = ValueDetector()
+
+    def redact(self, message: str) -> str:
+        """ Redact message with ***
+        """
+        return self.detector.redact(message, '***')
+
+    def test_email(self):
+        """ Email in the middle of a sentence
+        """
+        self.assertEqual(self.redact('mail bob.s+1@mail.example.com now'),
+                         'mail *** now')
+
+    def test_phone(self):
+        """ Phone numbers in the middle of a sentence
+        """
+        self.assertEqual(self.redact('call 555-123-4567 now'),
+                         'call *** now')
+        self.assertEqual(self.redact('call (555) 123-4567 now'),
+                         'call *** now')
+        self.assertEqual(self.redact('call +1 555.123.4567, now'),
+                         'call +***, now')
+
+    def test_ssn(self):
+        """ SSN in the middle of a sentence
+        """
+        self.assertEqual(self.redact('ssn 123-45-6789 leaked'),
+                         'ssn *** leaked')
+
+    def test_card(self):
+        """ Card numbers in the middle of a sentence, Luhn checked
+        """
+        self.assertEqual(self.redact('card 4111 1111 1111 1111 x'),
+                         'card *** x')
+        self.assertEqual(self.redact('card 4111-1111-1111-1112 x'),
+                         'card 4111-1111-1111-1112 x')
+
+    def test_end_of_line(self):
+        """ Values at the end of the message
+        """
+        self.assertEqual(self.redact('ssn 123-45-6789'), 'ssn ***')
+        self.assertEqual(self.redact('call 555 123 4567'), 'call ***')
+
+    def test_not_values(self):
+        """ Digits glued to words, dates and short numbers are kept
+        """
+        for message in ('id abc5551234567 ok', 'at 2024-01-01 12:00:00',
+                        'order 12345 shipped', 'v1.2.3.4 released'):
+            self.assertEqual(self.redact(message), message)
+
+    def test_digits_local_part(self):
+        """ Digits before @ are the local part of an email
+        """
+        self.assertEqual(self.redact('to 5551234567@sms.example.com ok'),
+                         'to *** ok')
+
+    def test_findall(self):
+        """ Kinds of the values
+        """
+        self.assertEqual(
+            [kind for kind, _ in self.detector.findall(
+                'a 123-45-6789 b 4111111111111111 c (555) 123-4567 d '
+                'x@y.io e')],
+            ['ssn', 'card', 'phone', 'email'])
+
+
+class TestStructuredFormat(unittest.TestCase):
+    """ Records carrying a dict of fields
+    """
+
+    def record(self, data: dict, stack_info: str = None) -> logging.LogRecord:
+        """ Return a record with data as extra fields
+        """
+        record = logging.LogRecord('test', logging.INFO, __file__, 1,
+                                   'user updated', None, None,
+                                   sinfo=stack_info)
+        record.data = data
+        return record
+
+    def test_json_fields_kept(self):
+        """ Fields named like the envelope keys are not overwritten
+        """
+        formatter = RedactingFormatter(['email'], structured='json')
+        line = json.loads(formatter.format(self.record(
+            {'message': 'hi', 'level': 3, 'email': 'bob@x.io'})))
+        self.assertEqual(line['message'], 'user updated')
+        self.assertEqual(line['level'], 'INFO')
+        self.assertEqual(line['data'],
+                         {'message': 'hi', 'level': 3, 'email': '***'})
+
+    def test_stack_info_redacted(self):
+        """ The stack is kept and redacted on both structured paths
+        """
+        stack = 'Stack (most recent call last):\n  send(email=bob@x.io;)'
+        for structured in RedactingFormatter.STRUCTURED_MODES:
+            formatter = RedactingFormatter(['email'], structured=structured,
+                                           detect_values=True)
+            line = formatter.format(self.record({'id': 1}, stack))
+            if structured == 'json':
+                line = json.loads(line)['stack_info']
+            self.assertIn('send(email=***;)', line)
+            self.assertNotIn('bob@x.io', line)
+
+
+class ListHandler(logging.Handler):
+    """ Handler keeping the messages of the records it handles
+    """
+
+    def __init__(self):
+        """ Initialize with no message
+        """
+        super(ListHandler, self).__init__()
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        """ Keep the formatted message of record
+        """
+        self.messages.append(self.format(record))
+
+
+class TestRateLimitingFilter(unittest.TestCase):
+    """ Sampling of identical records and their summaries
+    """
+
+    def setUp(self):
+        """ Build a logger with a filter letting 1 record out of 10 through
+        """
+        self.handler = ListHandler()
+        self.filter = RateLimitingFilter(sample_rate=10,
+                                         summary_interval=0.05)
+        self.logger = logging.getLogger('test_rate_limiting')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+        self.logger.addFilter(self.filter)
+
+    def tearDown(self):
+        """ Stop the filter and detach the handler
+        """
+        self.filter.stop()
+        self.logger.removeFilter(self.filter)
+        self.logger.removeHandler(self.handler)
+
+    def test_unhashable_message(self):
+        """ Records whose message is a dict are sampled like the others
+        """
+        for _ in range(20):
+            self.logger.info({'a': 1})
+        self.assertEqual(self.handler.messages, ["{'a': 1}"] * 2)
+        self.assertEqual(self.filter.suppressed_total, 18)
+
+    def test_summary_after_burst(self):
+        """ The summary of a burst is emitted once it stopped
+        """
+        for _ in range(5):
+            self.logger.info('login failed for %s', 'bob')
+        deadline = time.monotonic() + 5
+        while len(self.handler.messages) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.handler.messages,
+                         ['login failed for bob',
+                          '4 similar records suppressed: '
+                          'login failed for %s'])
+
+
+class TestAsyncQueue(unittest.TestCase):
+    """ Overflow policies, counters and flush of the async pipeline
+    """
+
+    def handle(self, handler: AsyncQueueHandler, count: int):
+        """ Handle count records numbered from 0
+        """
+        for i in range(count):
+            handler.handle(logging.LogRecord('test', logging.INFO, None,
+                                             None, str(i), None, None))
+
+    def queued(self, handler: AsyncQueueHandler) -> list:
+        """ Return the messages left in the queue of handler
+        """
+        messages = []
+        while True:
+            try:
+                messages.append(handler.queue.get_nowait().getMessage())
+            except queue.Empty:
+                return messages
+
+    def test_drop_newest(self):
+        """ A full queue refuses the new records
+        """
+        handler = AsyncQueueHandler(queue.Queue(10), 'drop-newest')
+        self.handle(handler, 300)
+        self.assertEqual(handler.stats,
+                         {'enqueued': 10, 'dropped': 290, 'flushed': 0})
+        self.assertEqual(self.queued(handler), [str(i) for i in range(10)])
+
+    def test_drop_oldest(self):
+        """ A full queue evicts its oldest record, counted as dropped
+        only
+        """
+        handler = AsyncQueueHandler(queue.Queue(10), 'drop-oldest')
+        self.handle(handler, 300)
+        self.assertEqual(handler.stats,
+                         {'enqueued': 10, 'dropped': 290, 'flushed': 0})
+        self.assertEqual(self.queued(handler),
+                         [str(i) for i in range(290, 300)])
+
+    def test_stop_flushes(self):
+        """ Blocking records are all written, in order, by stop
+        """
+        target = ListHandler()
+        handler = AsyncQueueHandler(queue.Queue(5), 'block')
+        listener = AsyncQueueListener(handler, target)
+        listener.start()
+        self.handle(handler, 300)
+        handler.close()
+        self.assertEqual(target.messages, [str(i) for i in range(300)])
+        self.assertEqual(handler.stats,
+                         {'enqueued': 300, 'dropped': 0, 'flushed': 300})
+        listener.stop()
+
+
+class TestLoggerRegistry(unittest.TestCase):
+    """ Loggers built once from their registered sinks
+    """
+
+    def test_one_handler(self):
+        """ Repeated get_logger calls return the same logger with a
+        single handler
+        """
+        stream = io.StringIO()
+        register_logger('test_registry_once',
+                        [{'type': 'stream', 'stream': stream}])
+        loggers = [get_logger('test_registry_once') for _ in range(5)]
+        self.assertTrue(all(logger is loggers[0] for logger in loggers))
+        self.assertEqual(len(loggers[0].handlers), 1)
+        loggers[0].info("name=bob;")
+        self.assertEqual(stream.getvalue().count("name=***;"), 1)
+
+    def test_sinks_fields(self):
+        """ Each sink redacts its own fields
+        """
+        names, emails = io.StringIO(), io.StringIO()
+        register_logger('test_registry_sinks', [
+            {'type': 'stream', 'stream': names, 'fields': ['name']},
+            {'type': 'stream', 'stream': emails, 'fields': ['email']},
+        ])
+        get_logger('test_registry_sinks').info("name=bob;email=b@x.io;")
+        self.assertIn("name=***;email=b@x.io;", names.getvalue())
+        self.assertIn("name=bob;email=***;", emails.getvalue())
+
+    def test_register_again(self):
+        """ Registering a built logger again detaches its old handlers
+        """
+        old, new = io.StringIO(), io.StringIO()
+        register_logger('test_registry_again',
+                        [{'type': 'stream', 'stream': old}])
+        logger = get_logger('test_registry_again')
+        old_handlers = list(logger.handlers)
+        register_logger('test_registry_again',
+                        [{'type': 'stream', 'stream': new}])
+        logger = get_logger('test_registry_again')
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertNotIn(logger.handlers[0], old_handlers)
+        logger.info("name=bob;")
+        self.assertEqual(old.getvalue(), "")
+        self.assertIn("name=***;", new.getvalue())
+
+
+class TestExportUsers(unittest.TestCase):
+    """ Rows of a table streamed through the redacting logger
+    """
+
+    def setUp(self):
+        """ Build a users table and a logger redacting name and email
+        """
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.execute("CREATE TABLE users (name TEXT, "
+                                "email TEXT, last_login TEXT)")
+        self.connection.executemany(
+            "INSERT INTO users VALUES (?, ?, ?)",
+            [("user{}".format(i), "u{}@x.io".format(i), "2024-01-0{}".format(
+                i % 9 + 1)) for i in range(25)])
+        self.handler = ListHandler()
+        self.handler.setFormatter(RedactingFormatter(['name', 'email']))
+        self.logger = logging.getLogger('test_export_users')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        """ Detach the handler and close the database
+        """
+        self.logger.removeHandler(self.handler)
+        self.connection.close()
+
+    def test_rows_redacted(self):
+        """ Every row is logged once, in order, with its PII redacted
+        """
+        stats = export_users(self.connection, self.logger, batch_size=10)
+        self.assertEqual(stats['rows'], 25)
+        self.assertEqual(len(self.handler.messages), 25)
+        self.assertTrue(self.handler.messages[3].endswith(
+            "name=***;email=***;last_login=2024-01-04;"))
+        self.assertNotIn("u3@x.io", "".join(self.handler.messages))
+
+    def test_invalid_table(self):
+        """ Table names are never interpolated unchecked
+        """
+        with self.assertRaises(ValueError):
+            export_users(self.connection, self.logger, "users; DROP")
+
+    def test_get_db_sqlite(self):
+        """ Without a host, get_db opens the SQLite file
+        PERSONAL_DATA_DB_PATH, whatever the MySQL database name
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, "users.sqlite")
+            environ = dict(os.environ)
+            os.environ.pop("PERSONAL_DATA_DB_HOST", None)
+            os.environ["PERSONAL_DATA_DB_NAME"] = "holberton"
+            os.environ["PERSONAL_DATA_DB_PATH"] = db_path
+            try:
+                get_db().close()
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+            self.assertTrue(os.path.exists(db_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+""" Tests of redact_logs
+"""
+import io
+import os
+import tempfile
+import unittest
+
+from redact_logs import chunk_offsets, redact_file, redact_lines
+
+
+class TestRedactFile(unittest.TestCase):
+    """ Files redacted chunk by chunk in a process pool
+    """
+
+    def setUp(self):
+        """ Write a log file of numbered lines
+        """
+        self.lines = ["{} name=user{};email=u{}@x.io;ip=10.0.0.{};\n".format(
+            i, i, i, i % 256) for i in range(3000)]
+        fd, self.file_path = tempfile.mkstemp(suffix=".log")
+        with os.fdopen(fd, 'w') as f:
+            f.writelines(self.lines)
+
+    def tearDown(self):
+        """ Remove the log file
+        """
+        os.remove(self.file_path)
+
+    def test_chunks(self):
+        """ Chunks cover the file and end on line boundaries
+        """
+        offsets = chunk_offsets(self.file_path, 4096)
+        self.assertGreater(len(offsets), 10)
+        self.assertEqual(offsets[0][0], 0)
+        self.assertEqual(offsets[-1][1], os.path.getsize(self.file_path))
+        with open(self.file_path, 'rb') as f:
+            content = f.read()
+        for (start, end), (next_start, _) in zip(offsets, offsets[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(content[end - 1:end], b"\n")
+
+    def test_same_as_lines(self):
+        """ The output of several chunks is the one of redact_lines, in
+        order
+        """
+        output = io.BytesIO()
+        read = redact_file(self.file_path, output, chunk_size=4096,
+                           workers=2)
+        self.assertEqual(read, os.path.getsize(self.file_path))
+        self.assertEqual(output.getvalue().decode(),
+                         "".join(redact_lines(self.lines)))
+
+
+if __name__ == '__main__':
+    unittest.main()
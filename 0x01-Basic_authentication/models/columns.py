@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+""" Columns module: timestamps and categories of Base objects as arrays
+"""
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import compress
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+DAY = 24 * 60 * 60
+PERIODS = {'day': DAY, 'week': 7 * DAY}
+# epoch day 0 is a Thursday: weeks start 3 days before, on Monday
+PERIOD_ORIGINS = {'day': 0, 'week': -3 * DAY}
+ACTIVITY_DAYS = (1, 7, 30, 90)
+INITIAL_CAPACITY = 1024
+TIMESTAMP_COLUMNS = ('created_at', 'updated_at')
+
+
+def categorize(category_columns: dict, get: Callable) -> dict:
+    """ Return the category values of one object
+    Parameters:
+        category_columns: {name: (attribute, transform or None)}
+        get: returns the value of an attribute of the object
+    """
+    values = {}
+    for name, (attribute, transform) in category_columns.items():
+        value = get(attribute)
+        if type(value) is not str:
+            value = None
+        elif transform is not None:
+            value = transform(value)
+        values[name] = value
+    return values
+
+
+def _new_array(typecode: str, capacity: int):
+    """ Return a zeroed array of capacity items, int64 for q and bool
+    for b
+    """
+    if np is not None:
+        return np.zeros(capacity, dtype=np.int64 if typecode == 'q'
+                        else np.bool_)
+    return array(typecode, bytes(capacity * array(typecode).itemsize))
+
+
+def _grow(column, capacity: int):
+    """ Return column grown to capacity items, zeroed
+    """
+    if np is not None:
+        grown = np.zeros(capacity, dtype=column.dtype)
+        grown[:len(column)] = column
+        return grown
+    column.extend(_new_array(column.typecode, capacity - len(column)))
+    return column
+
+
+def _copy(column, size: int):
+    """ Return a copy of the first size items of column
+    """
+    if np is not None:
+        return column[:size].copy()
+    return column[:size]
+
+
+class Columns():
+    """ One row per object of a class: its created_at and updated_at
+    epoch seconds, and for each category column the code of its value
+    (-1 for None). Rows of removed objects are reused. The arrays are
+    numpy arrays when numpy is installed, answering the queries with
+    vectorized operations, else array module arrays
+    """
+
+    def __init__(self, categories: Tuple[str, ...] = (),
+                 capacity: int = INITIAL_CAPACITY):
+        """ Initialize empty Columns
+        Parameters:
+            categories: names of the category columns
+        """
+        self.rows = {}
+        self.free = []
+        self.size = 0
+        self.capacity = capacity
+        self.live = _new_array('b', capacity)
+        self.timestamps = {name: _new_array('q', capacity)
+                           for name in TIMESTAMP_COLUMNS}
+        self.codes = {name: _new_array('q', capacity) for name in categories}
+        self.values = {name: [] for name in categories}
+        self.lookup = {name: {} for name in categories}
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return self.size - len(self.free)
+
+    def _row(self, obj_id: str) -> int:
+        """ Return the row of obj_id, allocated if needed
+        """
+        row = self.rows.get(obj_id)
+        if row is not None:
+            return row
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self.capacity *= 2
+                self.live = _grow(self.live, self.capacity)
+                for columns in (self.timestamps, self.codes):
+                    for name, column in columns.items():
+                        columns[name] = _grow(column, self.capacity)
+            row = self.size
+            self.size += 1
+        self.rows[obj_id] = row
+        return row
+
+    def _code(self, name: str, value) -> int:
+        """ Return the code of value in the category column name
+        """
+        if value is None:
+            return -1
+        lookup = self.lookup[name]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.values[name])
+            self.values[name].append(value)
+        return code
+
+    def set(self, obj_id: str, created_at: int, updated_at: int,
+            categories: dict):
+        """ Insert or update the row of obj_id, None timestamps being
+        stored as 0
+        """
+        row = self._row(obj_id)
+        self.live[row] = True
+        self.timestamps['created_at'][row] = created_at or 0
+        self.timestamps['updated_at'][row] = updated_at or 0
+        for name, column in self.codes.items():
+            column[row] = self._code(name, categories.get(name))
+
+    def discard(self, obj_id: str):
+        """ Remove the row of obj_id if any
+        """
+        row = self.rows.pop(obj_id, None)
+        if row is not None:
+            self.live[row] = False
+            self.free.append(row)
+
+    def copy(self) -> 'Columns':
+        """ Return a copy of the arrays to query, sharing the category
+        values (only ever appended to) and without the rows of the ids:
+        it can not be updated
+        """
+        columns = Columns((), 0)
+        columns.capacity = self.size
+        columns.free = list(self.free)
+        columns.size = self.size
+        columns.live = _copy(self.live, self.size)
+        columns.timestamps = {name: _copy(column, self.size)
+                              for name, column in self.timestamps.items()}
+        columns.codes = {name: _copy(column, self.size)
+                         for name, column in self.codes.items()}
+        columns.values = dict(self.values)
+        return columns
+
+    def _live(self, column) -> list:
+        """ Return the values of column in the rows of live objects
+        """
+        size = self.size
+        if np is not None:
+            return column[:size][self.live[:size]]
+        return list(compress(column[:size], self.live[:size]))
+
+    def histogram(self, column: str = 'created_at', period: str = 'day',
+                  since: int = None) -> List[Tuple[int, int]]:
+        """ Return (start of period in epoch seconds, number of objects)
+        of the periods holding at least one timestamp of column, the
+        ones before since excluded, oldest first
+        """
+        step = PERIODS[period]
+        origin = PERIOD_ORIGINS[period]
+        values = self._live(self.timestamps[column])
+        if np is not None:
+            if since is not None:
+                values = values[values >= since]
+            buckets, counts = np.unique((values - origin) // step,
+                                        return_counts=True)
+            return [(int(bucket) * step + origin, int(count))
+                    for bucket, count in zip(buckets, counts)]
+        counts = Counter((value - origin) // step for value in values
+                         if since is None or value >= since)
+        return [(bucket * step + origin, counts[bucket])
+                for bucket in sorted(counts)]
+
+    def ages(self, column: str, now: int,
+             days: Tuple[int, ...] = ACTIVITY_DAYS) -> List[int]:
+        """ Return the number of objects whose timestamp of column is
+        less than days[0] days before now, then between days[0] and
+        days[1], ..., and the number of the older ones last
+        """
+        edges = [d * DAY for d in days]
+        values = self._live(self.timestamps[column])
+        if np is not None:
+            buckets = np.searchsorted(np.asarray(edges), now - values,
+                                      side='right')
+            return [int(count) for count in
+                    np.bincount(buckets, minlength=len(edges) + 1)]
+        counts = [0] * (len(edges) + 1)
+        for value in values:
+            counts[bisect_right(edges, now - value)] += 1
+        return counts
+
+    def group_count(self, name: str, top: int = None) -> Dict[str, int]:
+        """ Return {value: number of objects} of the category column
+        name, the top most frequent only if given, None values under
+        the None key
+        """
+        codes = self._live(self.codes[name])
+        values = self.values[name]
+        if np is not None:
+            counts = np.bincount(codes + 1, minlength=len(values) + 1)
+            present = np.flatnonzero(counts)
+            order = present[np.argsort(-counts[present], kind='stable')]
+            if top is not None:
+                order = order[:top]
+            pairs = [(int(code) - 1, int(counts[code])) for code in order]
+        else:
+            pairs = Counter(codes).most_common(top)
+        return {(values[code] if code >= 0 else None): count
+                for code, count in pairs}
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+""" Lazy store module: objects kept as compact raw records until used
+"""
+import json
+import marshal
+import threading
+from typing import Callable, Iterable, Iterator, Tuple
+
+
+CHUNK_SIZE = 64 * 1024
+_LAYOUTS = {}
+
+
+def shared_layout(keys: tuple) -> tuple:
+    """ Return the tuple of keys shared by every raw record with keys
+    """
+    layout = _LAYOUTS.get(keys)
+    if layout is None:
+        layout = _LAYOUTS[keys] = keys
+    return layout
+
+
+def to_raw(obj_json: dict) -> tuple:
+    """ Return the compact raw form of a JSON dictionary: a shared
+    tuple of keys and a tuple of values
+    """
+    return (shared_layout(tuple(obj_json.keys())), tuple(obj_json.values()))
+
+
+def is_raw(value) -> bool:
+    """ True if value is a raw record, not a hydrated object
+    """
+    return type(value) is tuple
+
+
+def raw_to_json(raw: tuple) -> dict:
+    """ Return the JSON dictionary of a raw record
+    """
+    return dict(zip(raw[0], raw[1]))
+
+
+def raw_get(raw: tuple, attribute: str, default=None):
+    """ Return one attribute of a raw record without hydrating it
+    """
+    try:
+        return raw[1][raw[0].index(attribute)]
+    except ValueError:
+        return default
+
+
+class _PagedOut():
+    """ Marker of the entries of a LazyStore written to its pager
+    """
+
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        """ Representation of the marker
+        """
+        return 'PAGED_OUT'
+
+
+PAGED_OUT = _PagedOut()
+
+
+def resolve(store: dict, key: str, value):
+    """ Return a stored value, read back from the pager of store as a
+    raw record if it is paged out
+    """
+    if value is PAGED_OUT:
+        return store.pager.read(key)
+    return value
+
+
+class LazyStore(dict):
+    """ Dictionary id -> object of one class whose values may be raw
+    records, hydrated into objects the first time they are read.
+    With a pager (see models.pager) only the most recently used objects
+    stay in memory: raw records and evicted objects are written to its
+    file, PAGED_OUT taking their place, and read back when accessed
+    """
+
+    def __init__(self, cls, *args, pager=None, **kwargs):
+        """ Initialize a LazyStore of cls objects
+        """
+        super().__init__(*args, **kwargs)
+        self.cls = cls
+        self.pager = pager
+        self.lock = threading.Lock()
+
+    def _hydrate(self, key: str, value):
+        """ Replace a raw record by its object, once even when several
+        readers hydrate it at the same time
+        """
+        if self.pager is not None:
+            return self._page_in(key)
+        if not is_raw(value):
+            return value
+        with self.lock:
+            current = dict.get(self, key)
+            if current is not None and not is_raw(current):
+                return current
+            obj = self.cls.from_records((raw_to_json(value),))[0]
+            if current is value:
+                dict.__setitem__(self, key, obj)
+        return obj
+
+    def _page_in(self, key: str):
+        """ Return the object of key, read back from the pager if it is
+        paged out, and mark it as the most recently used
+        """
+        with self.lock:
+            current = dict.get(self, key)
+            if current is None:
+                return None
+            loaded = None
+            if current is not PAGED_OUT:
+                self.pager.stats['hits'] += 1
+                obj = current
+            else:
+                self.pager.stats['misses'] += 1
+                self.pager.stats['paged'] -= 1
+                loaded = self.pager.read_bytes(key)
+                keys, values = marshal.loads(loaded)
+                obj = self.cls.from_records((dict(zip(keys, values)),))[0]
+                dict.__setitem__(self, key, obj)
+            self._evict(self.pager.touch(key, obj, loaded))
+        return obj
+
+    def _evict(self, evicted: list):
+        """ Write the objects of evicted (key, serialized raw record
+        read back) to the pager if they changed, must be called with the
+        lock held
+        """
+        for key, loaded in evicted:
+            obj = dict.get(self, key)
+            if obj is None or obj is PAGED_OUT:
+                continue
+            self.pager.write(key, to_raw(obj.to_json(True)), loaded)
+            self.pager.stats['paged'] += 1
+            dict.__setitem__(self, key, PAGED_OUT)
+
+    def __setitem__(self, key: str, value):
+        """ Store an object or raw record under key, the raw record
+        being paged out and the object marked as the most recently used
+        when there is a pager
+        """
+        if self.pager is None:
+            dict.__setitem__(self, key, value)
+            return
+        with self.lock:
+            self._drop(key)
+            if is_raw(value):
+                self.pager.write(key, value)
+                self.pager.stats['paged'] += 1
+                dict.__setitem__(self, key, PAGED_OUT)
+            else:
+                dict.__setitem__(self, key, value)
+                self._evict(self.pager.touch(key, value))
+
+    def _drop(self, key: str):
+        """ Forget the paging state of key, must be called with the lock
+        held. The file keeps its last raw record until overwritten
+        """
+        previous = dict.get(self, key)
+        if previous is PAGED_OUT:
+            self.pager.stats['paged'] -= 1
+        elif previous is not None:
+            self.pager.forget(key)
+
+    def __delitem__(self, key: str):
+        """ Remove key
+        """
+        if self.pager is None:
+            dict.__delitem__(self, key)
+            return
+        with self.lock:
+            if key not in self:
+                raise KeyError(key)
+            self._drop(key)
+            dict.__delitem__(self, key)
+
+    def pop(self, key: str, *default):
+        """ Remove key and return its object or raw record, or default
+        """
+        if self.pager is None:
+            return dict.pop(self, key, *default)
+        with self.lock:
+            if key not in self:
+                return dict.pop(self, key, *default)
+            value = resolve(self, key, dict.get(self, key))
+            self._drop(key)
+            dict.__delitem__(self, key)
+        return value
+
+    def hydrate_all(self) -> int:
+        """ Build every raw record left in one from_records call, unless
+        there is a pager
+        Return:
+            number of objects built
+        """
+        if self.pager is not None:
+            return 0
+        with self.lock:
+            keys = [key for key, value in dict.items(self) if is_raw(value)]
+            if not keys:
+                return 0
+            objs = self.cls.from_records([raw_to_json(dict.get(self, key))
+                                          for key in keys])
+            for key, obj in zip(keys, objs):
+                dict.__setitem__(self, key, obj)
+        return len(keys)
+
+    def __getitem__(self, key: str):
+        """ Return the object of key, hydrating it if needed
+        """
+        return self._hydrate(key, dict.__getitem__(self, key))
+
+    def get(self, key: str, default=None):
+        """ Return the object of key (hydrated) or default
+        """
+        value = dict.get(self, key, default)
+        if value is default:
+            return default
+        return self._hydrate(key, value)
+
+    def values(self) -> Iterator:
+        """ Iterate over the objects, hydrating them
+        """
+        for key, value in dict.items(self):
+            yield self._hydrate(key, value)
+
+    def items(self) -> Iterator[Tuple[str, object]]:
+        """ Iterate over (id, object), hydrating the objects
+        """
+        for key, value in dict.items(self):
+            yield key, self._hydrate(key, value)
+
+    def copy(self, keys: Iterable[str] = None) -> 'LazyStore':
+        """ Shallow copy of every entry, or of the ones of keys, raw
+        records staying raw and paged out entries paged out
+        """
+        if keys is None:
+            entries = dict.copy(self)
+        else:
+            entries = {key: dict.get(self, key) for key in keys}
+        return LazyStore(self.cls, entries, pager=self.pager)
+
+    def hydrated_count(self) -> int:
+        """ Number of records already hydrated into objects
+        """
+        if self.pager is not None:
+            return len(self.pager.lru)
+        return sum(1 for value in dict.values(self) if not is_raw(value))
+
+
+def iter_json(store: dict) -> Iterator[Tuple[str, dict]]:
+    """ Iterate over (id, JSON dictionary) of a store without
+    hydrating its raw records
+    """
+    for key, value in dict.items(store):
+        value = resolve(store, key, value)
+        if is_raw(value):
+            yield key, raw_to_json(value)
+        else:
+            yield key, value.to_json(True)
+
+
+def iter_raw(store: dict) -> Iterator[Tuple[str, tuple]]:
+    """ Iterate over (id, raw record) of a store, objects being
+    converted to raw records
+    """
+    for key, value in dict.items(store):
+        value = resolve(store, key, value)
+        if is_raw(value):
+            yield key, value
+        else:
+            yield key, to_raw(value.to_json(True))
+
+
+def iter_json_object(f, chunk_size: int = CHUNK_SIZE,
+                     progress: Callable = None) -> Iterator[Tuple[str, dict]]:
+    """ Stream the (key, value) pairs of the top-level JSON object of
+    the text file f, keeping at most about one chunk and one value in
+    memory. Values must be JSON objects
+    Parameters:
+        f: file opened in text mode
+        chunk_size: number of characters read at once
+        progress: called with the number of characters read so far
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    read = 0
+    eof = False
+
+    def _refill():
+        nonlocal buf, pos, read, eof
+        chunk = f.read(chunk_size)
+        if chunk == "":
+            eof = True
+        read += len(chunk)
+        buf = buf[pos:] + chunk
+        pos = 0
+        if progress is not None:
+            progress(read)
+
+    def _skip_ws():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\n\r":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            _refill()
+
+    def _decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                pos = end
+                return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                _refill()
+
+    _skip_ws()
+    if pos >= len(buf):
+        return
+    if buf[pos] != "{":
+        raise ValueError("expected a JSON object")
+    pos += 1
+    while True:
+        _skip_ws()
+        if pos >= len(buf):
+            raise ValueError("unterminated JSON object")
+        if buf[pos] == "}":
+            return
+        if buf[pos] == ",":
+            pos += 1
+            continue
+        key = _decode()
+        _skip_ws()
+        if pos >= len(buf) or buf[pos] != ":":
+            raise ValueError("expected ':' after key {}".format(key))
+        pos += 1
+        _skip_ws()
+        value = _decode()
+        yield key, value
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
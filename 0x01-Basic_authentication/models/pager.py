@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+""" Pager module: hot objects in memory, cold ones in a keyed file
+"""
+import marshal
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from typing import List, Tuple
+
+from models.lazy_store import shared_layout
+
+
+class Pager():
+    """ LRU of the hot objects of one LazyStore, bounded by a number of
+    objects and/or an estimate of their size in bytes, and the file
+    holding the raw records of the cold ones, an SQLite table keyed by
+    id. The file is a cache of the process: created empty, without
+    journal nor sync, and removed on close. The LRU and counters are
+    only changed with the lock of the LazyStore held
+    """
+
+    def __init__(self, file_path: str, max_objects: int = 0,
+                 max_bytes: int = 0):
+        """ Initialize a Pager
+        Parameters:
+            file_path: path of the file, replaced if it exists
+            max_objects: maximum number of hot objects, 0 for no limit
+            max_bytes: maximum estimated size of the hot objects, 0 for
+                no limit
+        """
+        self.file_path = file_path
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.db = sqlite3.connect(file_path, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=OFF")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("CREATE TABLE pages (id TEXT PRIMARY KEY, "
+                        "data BLOB) WITHOUT ROWID")
+        self.db_lock = threading.Lock()
+        self.lru = OrderedDict()
+        self.bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'paged': 0}
+
+    def write(self, key: str, raw: tuple, loaded: bytes = None):
+        """ Write the raw record of key to the file, unless it is the
+        one loaded from it
+        """
+        data = marshal.dumps(raw)
+        if data == loaded:
+            return
+        with self.db_lock:
+            self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?)",
+                            (key, data))
+
+    def read(self, key: str) -> tuple:
+        """ Read the raw record of key from the file
+        """
+        keys, values = marshal.loads(self.read_bytes(key))
+        return (shared_layout(keys), values)
+
+    def read_bytes(self, key: str) -> bytes:
+        """ Read the serialized raw record of key from the file
+        """
+        with self.db_lock:
+            return self.db.execute("SELECT data FROM pages WHERE id = ?",
+                                   (key,)).fetchone()[0]
+
+    def size_of(self, obj) -> int:
+        """ Estimate the bytes used by a hot object and its values, 0
+        when there is no memory budget
+        """
+        if not self.max_bytes:
+            return 0
+        return sys.getsizeof(obj) + sum(
+            sys.getsizeof(value) for value in obj.to_json(True).values())
+
+    def touch(self, key: str, obj,
+              loaded: bytes = None) -> List[Tuple[str, bytes]]:
+        """ Mark obj, stored under key, as the most recently used
+        Parameters:
+            loaded: serialized raw record obj was read back from
+        Return:
+            (key, serialized raw record it was read back from) to evict
+            to stay within the budget, oldest first
+        """
+        if key in self.lru:
+            self.lru.move_to_end(key)
+            return []
+        size = self.size_of(obj)
+        self.lru[key] = (size, loaded)
+        self.bytes += size
+        evicted = []
+        while len(self.lru) > 1 and (
+                (self.max_objects and len(self.lru) > self.max_objects) or
+                (self.max_bytes and self.bytes > self.max_bytes)):
+            old_key, (old_size, old_loaded) = self.lru.popitem(last=False)
+            self.bytes -= old_size
+            evicted.append((old_key, old_loaded))
+        self.stats['evictions'] += len(evicted)
+        return evicted
+
+    def forget(self, key: str):
+        """ Drop key from the hot objects
+        """
+        entry = self.lru.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[0]
+
+    def snapshot_stats(self) -> dict:
+        """ Return the counters with the number and size of the hot
+        objects
+        """
+        stats = dict(self.stats)
+        stats['hot'] = len(self.lru)
+        stats['hot_bytes'] = self.bytes
+        return stats
+
+    def close(self):
+        """ Close and remove the file
+        """
+        with self.db_lock:
+            if self.db is None:
+                return
+            self.db.close()
+            self.db = None
+        if os.path.exists(self.file_path):
+            os.remove(self.file_path)
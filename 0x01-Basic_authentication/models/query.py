@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+""" Query module: filters of Base.query
+"""
+import operator
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from models.snapshot import TIMESTAMP_KEYS, timestamp_to_int
+
+
+Condition = namedtuple('Condition', ['attribute', 'op', 'value'])
+OPERATORS = {
+    'eq': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'startswith': lambda value, prefix: value.startswith(prefix),
+}
+SQL_OPERATORS = {'eq': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+def to_value(attribute: str, value):
+    """ Return value as compared by the queries: timestamps (datetime,
+    string or epoch seconds) become epoch seconds
+    """
+    if attribute not in TIMESTAMP_KEYS or value is None:
+        return value
+    if isinstance(value, datetime):
+        return (value - _EPOCH) // _SECOND
+    return timestamp_to_int(value)
+
+
+def parse_filters(filters: dict = None) -> List[Condition]:
+    """ Parse filters {attribute[__op]: value} in conditions, op being
+    one of OPERATORS (eq when missing)
+    """
+    conditions = []
+    for key, value in (filters or {}).items():
+        attribute, _, op = key.rpartition('__')
+        if not attribute or op not in OPERATORS:
+            attribute, op = key, 'eq'
+        if op == 'startswith' and not isinstance(value, str):
+            raise ValueError("{}: startswith needs a string".format(key))
+        conditions.append(Condition(attribute, op, to_value(attribute,
+                                                            value)))
+    return conditions
+
+
+def attribute_value(obj, attribute: str):
+    """ Return the attribute of obj as compared by the queries, None
+    when missing
+    """
+    if attribute in TIMESTAMP_KEYS:
+        return getattr(obj, '_' + attribute, None)
+    return getattr(obj, attribute, None)
+
+
+def matches(obj, conditions: List[Condition]) -> bool:
+    """ True if obj meets every condition. A missing value, or one that
+    can not be compared, only matches equality to None
+    """
+    for attribute, op, value in conditions:
+        current = attribute_value(obj, attribute)
+        if op == 'eq':
+            if current != value:
+                return False
+            continue
+        if current is None:
+            return False
+        try:
+            if not OPERATORS[op](current, value):
+                return False
+        except (TypeError, AttributeError):
+            return False
+    return True
+
+
+def prefix_end(prefix: str) -> str:
+    """ Return the smallest string greater than every string starting
+    with prefix, None if there is none
+    """
+    while prefix:
+        last = ord(prefix[-1])
+        if last < 0x10ffff:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+def sort_key(attribute: str) -> Callable:
+    """ Return the sort key of objects by attribute, None first
+    """
+    def _key(obj):
+        value = attribute_value(obj, attribute)
+        return (value is not None, value)
+    return _key
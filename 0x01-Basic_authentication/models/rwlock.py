@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" RWLock module: readers/writer lock
+"""
+import threading
+from contextlib import contextmanager
+from typing import Iterator
+
+
+class RWLock():
+    """ Lock shared by any number of readers or held by one writer.
+    Waiting writers go first so that readers can not starve them, and
+    the writing thread may take the lock again, to read or write
+    """
+
+    def __init__(self):
+        """ Initialize a RWLock
+        """
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writer = None
+        self.writes = 0
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        """ Take the lock as a reader
+        """
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.writes += 1
+                return
+            while self.writer is not None or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        """ Release a read of the lock
+        """
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self._release_write()
+                return
+            self.readers -= 1
+            if self.readers == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        """ Take the lock as the only writer
+        """
+        me = threading.get_ident()
+        with self.condition:
+            if self.writer == me:
+                self.writes += 1
+                return
+            self.waiting_writers += 1
+            while self.writer is not None or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writer = me
+            self.writes = 1
+
+    def release_write(self):
+        """ Release a write of the lock
+        """
+        with self.condition:
+            self._release_write()
+
+    def _release_write(self):
+        """ Release a write, must be called with the condition held
+        """
+        self.writes -= 1
+        if self.writes == 0:
+            self.writer = None
+            self.condition.notify_all()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """ Context manager holding the lock as a reader
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """ Context manager holding the lock as the writer
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+""" Snapshot module: JSON and binary snapshot file formats
+"""
+import json
+import marshal
+import struct
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Tuple
+
+from models.lazy_store import (iter_json, iter_json_object, iter_raw,
+                               shared_layout, to_raw)
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+TIMESTAMP_KEYS = ('created_at', 'updated_at')
+SNAPSHOT_FORMATS = ('json', 'binary')
+EXTENSIONS = {'json': 'json', 'binary': 'bin'}
+MAGIC = b"HBSNAP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">6sH")
+RECORD = struct.Struct(">BI")
+LAYOUT_RECORD = 0
+OBJECT_RECORD = 1
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+def timestamp_to_int(value) -> int:
+    """ Convert a TIMESTAMP_FORMAT string to epoch seconds, epoch
+    seconds being returned as is. Strings of the fixed 19 characters
+    layout are parsed by datetime.fromisoformat, about 10x faster than
+    strptime, which remains the parser of anything else
+    """
+    if type(value) is int:
+        return value
+    if len(value) == 19 and value[10] == 'T':
+        try:
+            return (datetime.fromisoformat(value) - _EPOCH) // _SECOND
+        except ValueError:
+            pass
+    return (datetime.strptime(value, TIMESTAMP_FORMAT) - _EPOCH) // _SECOND
+
+
+def timestamp_to_str(value: int) -> str:
+    """ Convert epoch seconds to a TIMESTAMP_FORMAT string
+    """
+    return time.strftime(TIMESTAMP_FORMAT, time.gmtime(value))
+
+
+def file_format(file_path: str) -> str:
+    """ Return the format of a snapshot file, read from its header
+    """
+    with open(file_path, 'rb') as f:
+        head = f.read(HEADER.size)
+    if len(head) == HEADER.size and HEADER.unpack(head)[0] == MAGIC:
+        return 'binary'
+    return 'json'
+
+
+def dumps_json(store: dict) -> bytes:
+    """ Serialize a store as a JSON object id -> JSON dictionary
+    """
+    objs = {}
+    for obj_id, obj_json in iter_json(store):
+        for key in TIMESTAMP_KEYS:
+            if type(obj_json.get(key)) is int:
+                obj_json[key] = timestamp_to_str(obj_json[key])
+        objs[obj_id] = obj_json
+    return json.dumps(objs).encode('utf-8')
+
+
+def dumps_binary(store: dict) -> bytes:
+    """ Serialize a store as a binary snapshot: a header (MAGIC and
+    FORMAT_VERSION) then length-prefixed marshal records, either a
+    layout (tuple of keys, numbered in order) or an object (layout
+    number and tuple of values). Timestamps are stored as epoch seconds
+    and each object must have an id
+    """
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION)]
+    layouts = {}
+    for obj_id, raw in iter_raw(store):
+        keys, values = raw
+        entry = layouts.get(keys)
+        if entry is None:
+            positions = tuple(i for i, key in enumerate(keys)
+                              if key in TIMESTAMP_KEYS)
+            entry = layouts[keys] = (len(layouts), positions)
+            payload = marshal.dumps(keys)
+            parts.append(RECORD.pack(LAYOUT_RECORD, len(payload)))
+            parts.append(payload)
+        number, positions = entry
+        if positions:
+            values = list(values)
+            for i in positions:
+                if type(values[i]) is str:
+                    values[i] = timestamp_to_int(values[i])
+            values = tuple(values)
+        payload = marshal.dumps((number, values))
+        parts.append(RECORD.pack(OBJECT_RECORD, len(payload)))
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def load_json(f, progress: Callable = None) -> Iterator[Tuple[str, tuple]]:
+    """ Yield (id, raw record) from a JSON snapshot opened in text mode
+    """
+    for obj_id, obj_json in iter_json_object(f, progress=progress):
+        if obj_json.get('id') == obj_id:
+            obj_json['id'] = obj_id
+        yield obj_id, to_raw(obj_json)
+
+
+def load_binary(f, progress: Callable = None) -> Iterator[Tuple[str, tuple]]:
+    """ Yield (id, raw record) from a binary snapshot opened in binary
+    mode, timestamps staying epoch seconds
+    """
+    head = f.read(HEADER.size)
+    if len(head) != HEADER.size or HEADER.unpack(head)[0] != MAGIC:
+        raise ValueError("not a binary snapshot")
+    version = HEADER.unpack(head)[1]
+    if version != FORMAT_VERSION:
+        raise ValueError("unsupported snapshot version {}".format(version))
+    layouts = []
+    read = HEADER.size
+    while True:
+        head = f.read(RECORD.size)
+        if len(head) < RECORD.size:
+            return
+        kind, length = RECORD.unpack(head)
+        payload = f.read(length)
+        if len(payload) < length:
+            raise ValueError("truncated snapshot")
+        read += RECORD.size + length
+        if kind == LAYOUT_RECORD:
+            keys = shared_layout(marshal.loads(payload))
+            layouts.append((keys, keys.index('id')))
+            continue
+        number, values = marshal.loads(payload)
+        keys, id_position = layouts[number]
+        if progress is not None:
+            progress(read)
+        yield values[id_position], (keys, values)
+
+
+def dumps(store: dict, snapshot_format: str = 'json') -> bytes:
+    """ Serialize a store in snapshot_format
+    """
+    if snapshot_format == 'binary':
+        return dumps_binary(store)
+    return dumps_json(store)
+
+
+def load(file_path: str,
+         progress: Callable = None) -> Iterator[Tuple[str, tuple]]:
+    """ Yield (id, raw record) from a snapshot file of any format
+    """
+    if file_format(file_path) == 'binary':
+        with open(file_path, 'rb') as f:
+            yield from load_binary(f, progress)
+    else:
+        with open(file_path, 'r') as f:
+            yield from load_json(f, progress)
+
+
+def convert(src_path: str, dst_path: str, snapshot_format: str) -> int:
+    """ Write the snapshot src_path to dst_path in snapshot_format
+    Return:
+        number of objects converted
+    """
+    store = dict(load(src_path))
+    content = dumps(store, snapshot_format)
+    with open(dst_path, 'wb') as f:
+        f.write(content)
+    return len(store)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+""" Storage module: interface of the storage backends of Base
+"""
+from typing import Callable, Iterator, List, TypeVar
+
+
+class Storage():
+    """ Storage backend of the Base objects, one collection per class.
+    Base.load_from_file, save, remove, get, search, iter_query, count
+    and all are delegated to the backend chosen by BASE_STORAGE_BACKEND
+    """
+
+    name = None
+
+    def load(self, cls, progress: Callable = None):
+        """ Prepare the collection of cls before its first use
+        """
+        raise NotImplementedError()
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or replace obj
+        """
+        raise NotImplementedError()
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Remove obj if it is stored
+        """
+        raise NotImplementedError()
+
+    def get(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Return the object of cls with obj_id, or None
+        """
+        raise NotImplementedError()
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects of cls whose attributes are all equal to
+        the ones given (all of them if attributes is empty)
+        """
+        raise NotImplementedError()
+
+    def query(self, cls, conditions: list, order_by: str = None,
+              limit: int = None, offset: int = 0) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects of cls meeting every condition
+        (see models.query), sorted by order_by (descending if prefixed
+        by -), skipping offset of them and stopping after limit
+        """
+        raise NotImplementedError()
+
+    def count(self, cls) -> int:
+        """ Return the number of objects of cls
+        """
+        raise NotImplementedError()
+
+    def columns(self, cls):
+        """ Return the column arrays (see models.columns) of cls
+        """
+        raise NotImplementedError()
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+""" Tests of the Base storage
+"""
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime
+
+from models import base, snapshot
+from models.change_feed import ChangeFeed
+from models.lazy_store import to_raw
+from models.sqlite_storage import SQLiteStorage
+from models.user import User
+
+
+class StoreTestCase(unittest.TestCase):
+    """ Tests run in an empty directory with empty stores, the settings
+    of models.base they change being restored after each test
+    """
+
+    SETTINGS = ('STORAGE_MODE', 'SNAPSHOT_FORMAT', 'SHARD_COUNT',
+                'HOT_OBJECTS', 'HOT_BYTES', 'PAGING_DIR',
+                'JOURNAL_COMPACT_BYTES', 'STORAGE', 'FEED',
+                'CHANGE_FEED_POLL')
+    STATE = ('DATA', 'INDEXES', 'SORTED_INDEXES', 'COLUMNS', 'JOURNALS',
+             'SHARD_MEMBERS', 'DIRTY_SHARDS', 'STATS', 'VERSIONS',
+             'FEED_STATE')
+
+    def setUp(self):
+        """ Move to a new directory and empty the stores
+        """
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.settings = {name: getattr(base, name) for name in self.SETTINGS}
+        self.state = {name: dict(getattr(base, name)) for name in self.STATE}
+        for name in self.STATE:
+            getattr(base, name).clear()
+        base.PAGING_DIR = self.directory.name
+
+    def tearDown(self):
+        """ Restore the stores, the settings and the directory
+        """
+        self.close()
+        for name, value in self.settings.items():
+            setattr(base, name, value)
+        for name, saved in self.state.items():
+            getattr(base, name).clear()
+            getattr(base, name).update(saved)
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def configure(self, **settings):
+        """ Change settings of models.base for this test
+        """
+        for name, value in settings.items():
+            setattr(base, name, value)
+
+    def close(self):
+        """ Close the journals and pagers of the stores
+        """
+        for journal in base.JOURNALS.values():
+            journal.close()
+        for store in base.DATA.values():
+            if getattr(store, 'pager', None) is not None:
+                store.pager.close()
+
+    def restart(self):
+        """ Forget everything held in memory, as a new process would,
+        and load the users again
+        """
+        self.close()
+        for name in self.STATE:
+            getattr(base, name).clear()
+        User.load_from_file()
+
+    def make_users(self, n: int) -> list:
+        """ Save n users and return them
+        """
+        users = []
+        for i in range(n):
+            user = User(email="u{:03d}@x.io".format(i),
+                        first_name="F{}".format(i % 3),
+                        created_at="2024-01-01T00:00:{:02d}".format(i % 60))
+            user.save()
+            users.append(user)
+        return users
+
+
+class TestJournal(StoreTestCase):
+    """ Saves and removes appended to a journal, replayed on load
+    """
+
+    def setUp(self):
+        """ Use the journal mode
+        """
+        super().setUp()
+        self.configure(STORAGE_MODE='journal')
+        User.load_from_file()
+
+    def test_replay(self):
+        """ A new process sees the saves and removes of the journal
+        """
+        users = self.make_users(5)
+        users[1].remove()
+        users[2].first_name = "Changed"
+        users[2].save()
+        self.assertTrue(os.path.exists(".db_User.journal"))
+        self.assertFalse(os.path.exists(".db_User.json"))
+        self.restart()
+        self.assertEqual(User.count(), 4)
+        self.assertIsNone(User.get(users[1].id))
+        self.assertEqual(User.get(users[2].id).first_name, "Changed")
+        self.assertEqual(User.search({'email': "u003@x.io"}), [users[3]])
+
+    def test_interrupted_compaction(self):
+        """ The journal set aside by a compaction that never wrote its
+        snapshot is replayed before the current one, even when it was
+        extended by a second interrupted compaction
+        """
+        users = self.make_users(4)
+        journal = User.journal()
+        with journal.lock:
+            journal.rotate()
+        users[0].remove()
+        users[1].first_name = "Second"
+        users[1].save()
+        with journal.lock:
+            journal.rotate()
+        users[1].first_name = "Third"
+        users[1].save()
+        self.assertTrue(os.path.exists(".db_User.journal.old"))
+        self.assertTrue(os.path.exists(".db_User.journal"))
+        self.assertFalse(os.path.exists(".db_User.json"))
+        self.restart()
+        self.assertEqual(User.count(), 3)
+        self.assertIsNone(User.get(users[0].id))
+        self.assertEqual(User.get(users[1].id).first_name, "Third")
+        self.assertEqual(User.search({'email': "u000@x.io"}), [])
+
+    def test_compaction(self):
+        """ A finished compaction writes the snapshot and removes the
+        journal it folded in
+        """
+        self.configure(JOURNAL_COMPACT_BYTES=1)
+        users = self.make_users(3)
+        journal = User.journal()
+        while journal.compacting:
+            time.sleep(0.01)
+        self.assertTrue(os.path.exists(".db_User.json"))
+        self.assertFalse(os.path.exists(".db_User.journal.old"))
+        self.assertGreater(journal.stats['compactions'], 0)
+        self.restart()
+        self.assertEqual(sorted(u.id for u in User.all()),
+                         sorted(u.id for u in users))
+
+
+class TestToJson(StoreTestCase):
+    """ to_json results cached until an attribute is assigned
+    """
+
+    def setUp(self):
+        """ Build a user and cache both variants of its JSON
+        """
+        super().setUp()
+        self.user = User(email="a@x.io", first_name="A",
+                         created_at="2024-01-01T00:00:00")
+        self.user.password = "secret"
+        self.public = self.user.to_json()
+        self.stored = self.user.to_json(True)
+
+    def test_cached(self):
+        """ Repeated calls return equal copies of the cached result
+        """
+        self.assertNotIn('_password', self.public)
+        self.assertIn('_password', self.stored)
+        copy = self.user.to_json()
+        self.assertEqual(copy, self.public)
+        copy['email'] = "changed"
+        self.assertEqual(self.user.to_json()['email'], "a@x.io")
+
+    def test_assignment(self):
+        """ Assigning declared attributes, properties or other
+        attributes drops both cached variants
+        """
+        self.user.first_name = "B"
+        self.assertEqual(self.user.to_json()['first_name'], "B")
+        self.assertEqual(self.user.to_json(True)['first_name'], "B")
+        self.user.password = "other"
+        self.assertNotEqual(self.user.to_json(True)['_password'],
+                            self.stored['_password'])
+        self.user.created_at = datetime(2025, 2, 3, 4, 5, 6)
+        self.assertEqual(self.user.to_json()['created_at'],
+                         "2025-02-03T04:05:06")
+        self.user.nickname = "b"
+        self.assertEqual(self.user.to_json()['nickname'], "b")
+
+    def test_stored_assignment(self):
+        """ Assigning an indexed attribute of a stored user drops the
+        cache too, and the saved snapshot holds the new value
+        """
+        User.load_from_file()
+        self.user.save()
+        self.user.email = "b@x.io"
+        self.assertEqual(self.user.to_json()['email'], "b@x.io")
+        self.user.save()
+        self.restart()
+        self.assertEqual(User.search({'email': "b@x.io"}), [self.user])
+
+
+class QueryTests():
+    """ Base.query tests run on each storage backend
+    """
+
+    def setUp(self):
+        """ Save 30 users created one second apart
+        """
+        super().setUp()
+        self.use_backend()
+        User.load_from_file()
+        self.users = self.make_users(30)
+
+    def emails(self, users: list) -> list:
+        """ Return the emails of users, in order
+        """
+        return [user.email for user in users]
+
+    def test_ranges(self):
+        """ Timestamps compare as datetime, string or epoch seconds
+        """
+        users = User.query({'created_at__gte': "2024-01-01T00:00:10",
+                            'created_at__lt': datetime(2024, 1, 1, 0, 0, 20)},
+                           order_by='created_at')
+        self.assertEqual(users, self.users[10:20])
+        epoch = base.to_epoch(datetime(2024, 1, 1, 0, 0, 25))
+        users = User.query({'created_at__gt': epoch}, order_by='created_at')
+        self.assertEqual(users, self.users[26:])
+        users = User.query({'email__lte': "u002@x.io"}, order_by='email')
+        self.assertEqual(users, self.users[:3])
+
+    def test_prefixes(self):
+        """ startswith selects a prefix, alone or with other filters
+        """
+        users = User.query({'email__startswith': "u01"}, order_by='email')
+        self.assertEqual(users, self.users[10:20])
+        users = User.query({'email__startswith': "u01", 'first_name': "F1"},
+                           order_by='email')
+        self.assertEqual(users, [u for u in self.users[10:20]
+                                 if u.first_name == "F1"])
+        self.assertEqual(User.query({'email__startswith': "v"}), [])
+
+    def test_ordering(self):
+        """ Ascending and descending, on indexed attributes or not
+        """
+        users = User.query(order_by='-email')
+        self.assertEqual(self.emails(users),
+                         list(reversed(self.emails(self.users))))
+        users = User.query({'created_at__lt': "2024-01-01T00:00:05"},
+                           order_by='-created_at')
+        self.assertEqual(users, list(reversed(self.users[:5])))
+        users = User.query(order_by='first_name')
+        self.assertEqual([user.first_name for user in users],
+                         sorted(user.first_name for user in self.users))
+
+    def test_paging(self):
+        """ Pages of limit objects after offset cover every object once
+        """
+        users = User.query(order_by='email', limit=5, offset=10)
+        self.assertEqual(users, self.users[10:15])
+        pages = []
+        for offset in range(0, 30, 7):
+            pages += User.query({'email__gte': "u"}, order_by='email',
+                                limit=7, offset=offset)
+        self.assertEqual(pages, self.users)
+        self.assertEqual(User.query(order_by='email', limit=3, offset=29),
+                         self.users[29:])
+
+    def test_changes(self):
+        """ Saves and removes are seen by the next queries
+        """
+        self.users[3].email = "a@x.io"
+        self.users[3].save()
+        self.users[4].remove()
+        users = User.query({'email__lt': "u006@x.io"}, order_by='email')
+        self.assertEqual(self.emails(users), ["a@x.io", "u000@x.io",
+                                              "u001@x.io", "u002@x.io",
+                                              "u005@x.io"])
+
+
+class TestMemoryQuery(QueryTests, StoreTestCase):
+    """ Base.query on the memory backend, through the sorted indexes
+    """
+
+    def use_backend(self):
+        """ Keep every object in DATA
+        """
+        self.configure(STORAGE=base.MemoryStorage())
+
+
+class TestSQLiteQuery(QueryTests, StoreTestCase):
+    """ Base.query on the SQLite backend, in SQL
+    """
+
+    def use_backend(self):
+        """ Keep every object in an SQLite database
+        """
+        self.configure(STORAGE=SQLiteStorage(".db.sqlite3"))
+
+
+class TestPaging(StoreTestCase):
+    """ Cold objects paged out of memory under a hot budget
+    """
+
+    def setUp(self):
+        """ Save 50 users, then load them with at most 5 hot objects
+        """
+        super().setUp()
+        User.load_from_file()
+        self.users = self.make_users(50)
+        self.configure(HOT_OBJECTS=5)
+        self.restart()
+        self.pager = base.DATA['User'].pager
+
+    def assertBudget(self):
+        """ Check the hot objects stay within the budget and every
+        object is either hot or paged out
+        """
+        stats = self.pager.snapshot_stats()
+        self.assertLessEqual(stats['hot'], 5)
+        self.assertEqual(stats['hot'] + stats['paged'], User.count())
+
+    def test_load(self):
+        """ Loaded records all go to the pager file
+        """
+        stats = self.pager.snapshot_stats()
+        self.assertEqual(stats['hot'], 0)
+        self.assertEqual(stats['paged'], 50)
+        self.assertEqual(User.count(), 50)
+
+    def test_eviction(self):
+        """ Reading every object evicts the least recently used ones
+        """
+        self.assertEqual(sorted(user.id for user in User.all()),
+                         sorted(user.id for user in self.users))
+        self.assertGreaterEqual(self.pager.stats['evictions'], 45)
+        self.assertEqual(self.pager.stats['misses'], 50)
+        self.assertBudget()
+        self.assertEqual(list(self.pager.lru), list(base.DATA['User'])[-5:])
+
+    def test_fault_in(self):
+        """ An evicted object comes back with its unsaved changes
+        """
+        user = User.get(self.users[0].id)
+        user.first_name = "Changed"
+        for other in self.users[1:10]:
+            User.get(other.id)
+        self.assertNotIn(user.id, self.pager.lru)
+        self.assertEqual(User.get(user.id).first_name, "Changed")
+        self.assertBudget()
+
+    def test_indexes(self):
+        """ Indexes and counts follow the changes of paged objects
+        """
+        user = User.get(self.users[3].id)
+        user.email = "changed@x.io"
+        user.save()
+        self.users[4].remove()
+        for other in self.users[10:20]:
+            User.get(other.id)
+        self.assertNotIn(user.id, self.pager.lru)
+        self.assertEqual(User.count(), 49)
+        self.assertEqual(User.search({'email': "u003@x.io"}), [])
+        self.assertEqual(User.search({'email': "changed@x.io"}), [user])
+        self.assertEqual(User.search({'email': "u004@x.io"}), [])
+        self.assertEqual(User.query({'email__startswith': "u00"},
+                                    order_by='email'),
+                         self.users[:3] + self.users[5:10])
+        counts = User.columns().group_count('first_name')
+        self.assertEqual(sum(counts.values()), 49)
+        self.assertEqual(counts["F1"], 16)
+        self.assertBudget()
+        self.restart()
+        self.assertEqual(User.search({'email': "changed@x.io"}), [user])
+        self.assertEqual(User.count(), 49)
+
+    def test_byte_budget(self):
+        """ A byte budget bounds the estimated size of the hot objects
+        """
+        self.configure(HOT_OBJECTS=0, HOT_BYTES=2000)
+        self.restart()
+        pager = base.DATA['User'].pager
+        for user in User.all():
+            self.assertLessEqual(pager.bytes, 2000)
+        self.assertGreater(pager.stats['evictions'], 0)
+        self.assertEqual(User.count(), 50)
+
+
+class TestChangeFeed(StoreTestCase):
+    """ Changes of other processes applied from the change feed
+    """
+
+    def setUp(self):
+        """ Save users with a change feed, then open the feed as another
+        process would
+        """
+        super().setUp()
+        self.configure(FEED=ChangeFeed("feed.sqlite3"), CHANGE_FEED_POLL=0)
+        User.load_from_file()
+        self.users = self.make_users(10)
+        self.remote = ChangeFeed("feed.sqlite3")
+
+    def remote_change(self, op: str, obj_id: str, obj_json: dict = None):
+        """ Save or remove an object in the snapshot file and publish
+        it, as another process would
+        """
+        objs = dict(snapshot.load(".db_User.json"))
+        if op == 'save':
+            objs[obj_id] = to_raw(obj_json)
+        else:
+            del objs[obj_id]
+        with open(".db_User.json", 'wb') as f:
+            f.write(snapshot.dumps(objs))
+        self.remote.publish('User', obj_id, op, obj_json)
+
+    def test_apply(self):
+        """ Remote saves and removes reach DATA and the indexes
+        """
+        new = User(email="new@x.io", created_at="2024-02-01T00:00:00")
+        changed = self.users[2].to_json(True)
+        changed['email'] = "changed@x.io"
+        self.remote_change('save', new.id, new.to_json(True))
+        self.remote_change('save', changed['id'], changed)
+        self.remote_change('remove', self.users[3].id)
+        self.assertEqual(base.sync_changes(), 3)
+        self.assertEqual(User.count(), 10)
+        self.assertEqual(User.search({'email': "new@x.io"}), [new])
+        self.assertEqual(User.search({'email': "changed@x.io"}),
+                         [self.users[2]])
+        self.assertEqual(User.search({'email': "u002@x.io"}), [])
+        self.assertIsNone(User.get(self.users[3].id))
+        users = User.query({'created_at__gte': "2024-02-01T00:00:00"})
+        self.assertEqual(users, [new])
+        self.assertEqual(base.sync_changes(), 0)
+
+    def test_own_changes(self):
+        """ Changes published by this process are not applied again,
+        and an older remote change does not undo a newer local one
+        """
+        changed = self.users[4].to_json(True)
+        changed['first_name'] = "Remote"
+        self.remote_change('save', changed['id'], changed)
+        self.users[4].first_name = "Local"
+        self.users[4].save()
+        self.assertEqual(base.sync_changes(), 0)
+        self.assertEqual(User.get(self.users[4].id).first_name, "Local")
+        self.remote_change('remove', self.users[5].id)
+        self.assertEqual(base.sync_changes(), 1)
+        self.assertEqual(User.count(), 9)
+
+    def test_reload_after_gap(self):
+        """ A class behind changes trimmed from the feed is reloaded
+        from the files
+        """
+        new = User(email="new@x.io")
+        self.remote_change('save', new.id, new.to_json(True))
+        self.remote_change('remove', self.users[6].id)
+        connection = self.remote.connection()
+        with connection:
+            connection.execute("DELETE FROM changes WHERE version < ?",
+                               (self.remote.last_version(),))
+        self.assertEqual(base.sync_changes(), 0)
+        self.assertEqual(User.storage_stats()['feed']['reloads'], 1)
+        self.assertEqual(User.search({'email': "new@x.io"}), [new])
+        self.assertIsNone(User.get(self.users[6].id))
+        self.assertEqual(User.count(), 10)
+        self.remote_change('remove', self.users[7].id)
+        self.assertEqual(base.sync_changes(), 1)
+        self.assertEqual(User.count(), 9)
+        self.assertEqual(User.storage_stats()['feed']['reloads'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import jsonify, abort, request
 from api.v1.views import app_views
+from models.columns import ACTIVITY_DAYS, DAY, PERIODS
+import time
 
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
@@ -26,6 +28,53 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route('/stats/users', methods=['GET'], strict_slashes=False)
+def users_stats() -> str:
+    """ GET /api/v1/stats/users
+    Query parameters:
+      - period: day (default) or week, period of the signups
+      - days: signups of the last days only (default 90, 0 for all)
+      - top: number of values per breakdown (default 10)
+    Return:
+      - the number of users, their signups per period, the number of
+        them last updated less than 1, 7, 30 and 90 days ago and
+        before (stale), and the most frequent email domains, first
+        names and last names
+      - 400 if a parameter is invalid
+    """
+    from models.user import User
+    period = request.args.get('period', 'day')
+    try:
+        days = int(request.args.get('days', 90))
+        top = int(request.args.get('top', 10))
+    except ValueError:
+        return jsonify({'error': "days and top must be integers"}), 400
+    if period not in PERIODS or days < 0 or top < 0:
+        return jsonify({'error': "invalid period, days or top"}), 400
+    now = int(time.time())
+    columns = User.columns()
+    signups = columns.histogram('created_at', period,
+                                now - days * DAY if days else None)
+    ages = columns.ages('updated_at', now)
+    activity = {"{}d".format(d): count
+                for d, count in zip(ACTIVITY_DAYS, ages)}
+    activity['stale'] = ages[-1]
+    stats = {
+        'users': len(columns),
+        'signups': {
+            'period': period,
+            'counts': [{'start': time.strftime("%Y-%m-%d", time.gmtime(t)),
+                        'users': count} for t, count in signups],
+        },
+        'activity': activity,
+    }
+    for name in User.CATEGORY_COLUMNS:
+        stats[name + 's'] = [{'value': value, 'users': count}
+                             for value, count in
+                             columns.group_count(name, top).items()]
+    return jsonify(stats)
+
+
 @app_views.route('/unauthorized', methods=['GET'], strict_slashes=False)
 def unauthorised() -> str:
     """ GET /api/v1/unauthorized
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+""" Benchmarks of the models storage
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from collections import Counter
+from typing import Callable, List
+
+from models import base, columns
+from models.lazy_store import to_raw
+from models.snapshot import SNAPSHOT_FORMATS
+from models.user import User
+
+
+USERS = 100000
+THREAD_COUNTS = (1, 2, 4, 8, 16)
+STRESS_USERS = 1000
+STRESS_OPS = 2000
+READ_RATIO = 0.8
+SHARD_COUNTS = (1, 4, 8)
+HOT_FRACTIONS = (0, 0.1, 0.01)
+PAGING_READS = 100000
+HOT_SET = 0.2
+
+
+class LegacyUser():
+    """ User as stored before the slotted representation: attributes in
+    __dict__ and datetime timestamps
+    """
+
+    def __init__(self, **kwargs):
+        """ Initialize a LegacyUser
+        """
+        self.id = kwargs.get('id')
+        self.created_at = datetime.strptime(kwargs.get('created_at'),
+                                            "%Y-%m-%dT%H:%M:%S")
+        self.updated_at = datetime.strptime(kwargs.get('updated_at'),
+                                            "%Y-%m-%dT%H:%M:%S")
+        self.email = kwargs.get('email')
+        self._password = kwargs.get('_password')
+        self.first_name = kwargs.get('first_name')
+        self.last_name = kwargs.get('last_name')
+
+
+def make_records(n: int) -> List[dict]:
+    """ Return n JSON dictionaries of users
+    """
+    return [{
+        'id': str(uuid.uuid4()),
+        'created_at': "2024-04-18T15:47:58",
+        'updated_at': "2024-04-18T15:47:58",
+        'email': "user{}@hbtn.io".format(i),
+        '_password': uuid.uuid4().hex * 2,
+        'first_name': "First{}".format(i),
+        'last_name': "Last{}".format(i),
+    } for i in range(n)]
+
+
+def bytes_per_object(build: Callable, records: List[dict]) -> float:
+    """ Return the memory allocated per record by build, the strings of
+    the records being allocated before the measure
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objs = [build(record) for record in records]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objs
+    return (after - before) / len(records)
+
+
+def memory(n: int = USERS):
+    """ Report the bytes per user of each representation
+    """
+    records = make_records(n)
+    results = {
+        'legacy (__dict__ + datetime)': bytes_per_object(
+            lambda r: LegacyUser(**r), records),
+        'slotted (__slots__ + epoch)': bytes_per_object(
+            lambda r: User(**r), records),
+        'raw record (LazyStore)': bytes_per_object(to_raw, records),
+    }
+    for name, value in results.items():
+        print("{:<32} {:>8.0f} bytes/user".format(name, value))
+
+
+def hydration(n: int = USERS):
+    """ Report the time to build n users through __init__ and through
+    from_records
+    """
+    records = make_records(n)
+    started = time.perf_counter()
+    by_init = [User(**record) for record in records]
+    init_s = time.perf_counter() - started
+    started = time.perf_counter()
+    by_records = User.from_records(records)
+    records_s = time.perf_counter() - started
+    assert all(a.to_json(True) == b.to_json(True)
+               for a, b in zip(by_init, by_records))
+    print("{:<14} {:>8.3f} s {:>8.2f} us/user".format(
+        "__init__", init_s, init_s * 1e6 / n))
+    print("{:<14} {:>8.3f} s {:>8.2f} us/user".format(
+        "from_records", records_s, records_s * 1e6 / n))
+
+
+def serialization(n: int = USERS):
+    """ Report the time to list n users with to_json, first building
+    the JSON dictionaries then from the cache
+    """
+    users = User.from_records(make_records(n))
+    for label in ("cold", "cached"):
+        started = time.perf_counter()
+        [user.to_json() for user in users]
+        elapsed = time.perf_counter() - started
+        print("{:<8} {:>8.3f} s {:>8.2f} us/user".format(
+            label, elapsed, elapsed * 1e6 / n))
+
+
+def snapshot_formats(n: int = USERS):
+    """ Report the save time, load time and file size of each snapshot
+    format, in a temporary directory
+    """
+    os.chdir(tempfile.mkdtemp())
+    records = make_records(n)
+    print("{:>8} {:>10} {:>10} {:>10} {:>12}".format(
+        "format", "save s", "load s", "hydrate s", "bytes/user"))
+    for snapshot_format in SNAPSHOT_FORMATS:
+        base.SNAPSHOT_FORMAT = snapshot_format
+        User.load_from_file()
+        store = base.DATA['User']
+        for record in records:
+            store[record['id']] = to_raw(record)
+        started = time.perf_counter()
+        User.save_to_file()
+        saved = time.perf_counter() - started
+        started = time.perf_counter()
+        User.load_from_file()
+        loaded = time.perf_counter() - started
+        started = time.perf_counter()
+        for user in User.all():
+            pass
+        hydrated = time.perf_counter() - started
+        size = os.path.getsize(User.snapshot_path())
+        print("{:>8} {:>10.3f} {:>10.3f} {:>10.3f} {:>12.1f}".format(
+            snapshot_format, saved, loaded, hydrated, size / n))
+
+
+def sharding(n: int = USERS, shard_counts=SHARD_COUNTS):
+    """ Report the bytes written by one save and the load time, by one
+    process and in parallel, of each number of shards, in a temporary
+    directory
+    """
+    os.chdir(tempfile.mkdtemp())
+    records = make_records(n)
+    print("{:>7} {:>12} {:>8} {:>10} {:>10}".format(
+        "shards", "bytes/save", "save s", "load s", "parallel s"))
+    for shard_count in shard_counts:
+        base.SHARD_COUNT = shard_count
+        User.load_from_file()
+        store = base.DATA['User']
+        for record in records:
+            store[record['id']] = to_raw(record)
+        User.save_to_file()
+        stats = User.storage_stats()
+        written = stats['bytes_written']
+        started = time.perf_counter()
+        User.get(records[0]['id']).save()
+        saved = time.perf_counter() - started
+        per_save = User.storage_stats()['bytes_written'] - written
+        loads = []
+        for workers in (1, shard_count):
+            base.LOAD_WORKERS = workers
+            started = time.perf_counter()
+            User.load_from_file()
+            loads.append(time.perf_counter() - started)
+        print("{:>7} {:>12} {:>8.3f} {:>10.3f} {:>10.3f}".format(
+            shard_count, per_save, saved, loads[0], loads[1]))
+        for shard in range(shard_count):
+            os.remove(User.snapshot_path(shard))
+
+
+def paging(n: int = USERS, reads: int = PAGING_READS,
+           hot_fractions=HOT_FRACTIONS):
+    """ Report the memory held by the objects, the time per get and the
+    hit ratio of each hot object budget (a fraction of n, 0 for no
+    paging), 80% of the gets going to HOT_SET of the users, in a
+    temporary directory
+    """
+    os.chdir(tempfile.mkdtemp())
+    records = make_records(n)
+    User.load_from_file()
+    store = base.DATA['User']
+    for record in records:
+        store[record['id']] = to_raw(record)
+    User.save_to_file()
+    ids = [record['id'] for record in records]
+    hot = ids[:max(1, int(n * HOT_SET))]
+    rand = random.Random(0)
+    sequence = [rand.choice(hot) if rand.random() < 0.8 else rand.choice(ids)
+                for _ in range(reads)]
+    print("{:>8} {:>10} {:>10} {:>8}".format(
+        "budget", "MiB", "us/get", "hits %"))
+    for fraction in hot_fractions:
+        budget = int(n * fraction)
+        base.HOT_OBJECTS = budget
+        gc.collect()
+        tracemalloc.start()
+        User.load_from_file()
+        for obj_id in sequence:
+            User.get(obj_id)
+        gc.collect()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        User.load_from_file()
+        started = time.perf_counter()
+        for obj_id in sequence:
+            User.get(obj_id)
+        elapsed = time.perf_counter() - started
+        stats = User.storage_stats().get('paging')
+        hits = 100.0 * stats['hits'] / reads if stats else 100.0
+        print("{:>8} {:>10.1f} {:>10.2f} {:>8.1f}".format(
+            budget or "none", current / 2 ** 20, elapsed * 1e6 / reads,
+            hits))
+    base.HOT_OBJECTS = 0
+
+
+def analytics(n: int = USERS):
+    """ Report the time of the /api/v1/stats/users computations through
+    the column arrays and by looping over User.all(), in a temporary
+    directory
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    store = base.DATA['User']
+    for record in make_records(n):
+        store[record['id']] = to_raw(record)
+    User.save_to_file()
+    now = int(time.time())
+    started = time.perf_counter()
+    User.columns()
+    print("{:<22} {:>10.1f} ms".format(
+        "build columns", (time.perf_counter() - started) * 1e3))
+
+    def _columns():
+        columns = User.columns()
+        columns.histogram('created_at', 'day')
+        columns.ages('updated_at', now)
+        for name in User.CATEGORY_COLUMNS:
+            columns.group_count(name, 10)
+
+    def _loop():
+        days = Counter()
+        domains = Counter()
+        for user in User.all():
+            days[user.created_at.date()] += 1
+            domains[(user.email or '').rpartition('@')[2]] += 1
+
+    for label, run in (("columns (numpy)" if columns.np is not None
+                        else "columns (array)", _columns),
+                       ("loop over User.all()", _loop)):
+        started = time.perf_counter()
+        run()
+        print("{:<22} {:>10.1f} ms".format(
+            label, (time.perf_counter() - started) * 1e3))
+
+
+def stress_run(n_threads: int, ops: int,
+               read_ratio: float = READ_RATIO) -> float:
+    """ Run n_threads threads mixing ops reads and writes each, every
+    thread updating its own users, then check that no update was lost
+    in memory nor in the file
+    Return:
+        operations per second
+    """
+    owned = [User(email="t{}@hbtn.io".format(i), first_name="0")
+             for i in range(n_threads)]
+    for user in owned:
+        user.save()
+    errors = []
+
+    def _worker(user):
+        rand = random.Random(user.id)
+        updates = 0
+        try:
+            for _ in range(ops):
+                if rand.random() < read_ratio:
+                    User.search({'email': user.email})
+                    User.count()
+                else:
+                    updates += 1
+                    user.first_name = str(updates)
+                    user.save()
+            if User.get(user.id).first_name != str(updates):
+                errors.append("lost update of {}".format(user.email))
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=_worker, args=(user,))
+               for user in owned]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    User.flush()
+
+    expected = {user.id: user.first_name for user in owned}
+    if os.path.exists(".db_User.json"):
+        with open(".db_User.json", 'r') as f:
+            json.load(f)
+    User.load_from_file()
+    for obj_id, first_name in expected.items():
+        if User.get(obj_id).first_name != first_name:
+            errors.append("lost update of {} after reload".format(obj_id))
+    for user in owned:
+        User.get(user.id).remove()
+    User.flush()
+    if errors:
+        raise AssertionError("; ".join(errors[:5]))
+    return n_threads * ops / elapsed
+
+
+def concurrency(ops: int = STRESS_OPS, thread_counts=THREAD_COUNTS):
+    """ Report the throughput of mixed reads and writes against the
+    number of threads, in a temporary directory
+    """
+    os.chdir(tempfile.mkdtemp())
+    User.load_from_file()
+    for record in make_records(STRESS_USERS):
+        User(**record).save()
+    print("{:>8} {:>12}".format("threads", "ops/s"))
+    for n_threads in thread_counts:
+        print("{:>8} {:>12.0f}".format(n_threads,
+                                       stress_run(n_threads, ops)))
+
+
+def main():
+    """ Command line entry point
+    """
+    parser = argparse.ArgumentParser(description="Models benchmarks")
+    parser.add_argument("benchmark",
+                        choices=["memory", "hydration", "serialization",
+                                 "concurrency", "snapshot", "sharding",
+                                 "paging", "analytics"])
+    parser.add_argument("-n", "--users", type=int, default=USERS)
+    parser.add_argument("--ops", type=int, default=STRESS_OPS,
+                        help="operations per thread of concurrency")
+    args = parser.parse_args()
+    if args.benchmark == "memory":
+        memory(args.users)
+    elif args.benchmark == "hydration":
+        hydration(args.users)
+    elif args.benchmark == "serialization":
+        serialization(args.users)
+    elif args.benchmark == "concurrency":
+        concurrency(args.ops)
+    elif args.benchmark == "snapshot":
+        snapshot_formats(args.users)
+    elif args.benchmark == "sharding":
+        sharding(args.users)
+    elif args.benchmark == "paging":
+        paging(args.users)
+    elif args.benchmark == "analytics":
+        analytics(args.users)
+
+
+if __name__ == "__main__":
+    main()
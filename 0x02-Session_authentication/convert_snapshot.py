@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+""" Convert a models snapshot file between the JSON and binary formats
+"""
+import argparse
+
+from models.snapshot import SNAPSHOT_FORMATS, convert
+
+
+def main():
+    """ Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Convert a .db_<Class> snapshot file, the source "
+                    "format being detected from its header")
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    parser.add_argument("-f", "--format", choices=SNAPSHOT_FORMATS,
+                        required=True, help="format of the destination")
+    args = parser.parse_args()
+    count = convert(args.source, args.destination, args.format)
+    print("{} objects written to {}".format(count, args.destination))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,243 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import TypeVar, List, Iterable, Iterator, Callable
 from os import path
-import json
+from models.change_feed import Change, ChangeFeed, FeedGapError, FeedPoller
+from models.journal import Journal
+from models import shards
+from models.columns import Columns, categorize
+from models.lazy_store import (PAGED_OUT, LazyStore, is_raw, raw_get,
+                               resolve, shared_layout, to_raw)
+from models.pager import Pager
+from models.query import (attribute_value, matches, parse_filters,
+                          prefix_end, sort_key, to_value)
+from models.rwlock import RWLock
+from models import snapshot
+from models.snapshot import TIMESTAMP_FORMAT, TIMESTAMP_KEYS, timestamp_to_int
+from models.sqlite_storage import SQLiteStorage
+from models.storage import Storage
+from models.writer import DeferredWriter, write_atomic
+from concurrent.futures import ProcessPoolExecutor
+import atexit
+import os
+import tempfile
+import threading
+import time
 import uuid
 
 
-TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+STORAGE_MODES = ('snapshot', 'journal', 'deferred')
+STORAGE_MODE = os.getenv("BASE_STORAGE_MODE", "snapshot")
+JOURNAL_COMPACT_BYTES = int(os.getenv("BASE_JOURNAL_COMPACT_BYTES",
+                                      4 * 1024 * 1024))
+FLUSH_INTERVAL = float(os.getenv("BASE_FLUSH_INTERVAL", 1.0))
+FLUSH_CHANGES = int(os.getenv("BASE_FLUSH_CHANGES", 100))
+FSYNC_POLICY = os.getenv("BASE_FSYNC", "none")
+SNAPSHOT_FORMAT = os.getenv("BASE_SNAPSHOT_FORMAT", "json")
+STORAGE_BACKEND = os.getenv("BASE_STORAGE_BACKEND", "memory")
+SQLITE_PATH = os.getenv("BASE_SQLITE_PATH", ".db.sqlite3")
+SHARD_COUNT = int(os.getenv("BASE_SHARDS", 1))
+LOAD_WORKERS = int(os.getenv("BASE_LOAD_WORKERS", os.cpu_count() or 1))
+HOT_OBJECTS = int(os.getenv("BASE_HOT_OBJECTS", 0))
+HOT_BYTES = int(os.getenv("BASE_HOT_BYTES", 0))
+PAGING_DIR = os.getenv("BASE_PAGING_DIR", tempfile.gettempdir())
+CHANGE_FEED_PATH = os.getenv("BASE_CHANGE_FEED")
+CHANGE_FEED_POLL = float(os.getenv("BASE_CHANGE_FEED_POLL", 1.0))
+CHANGE_FEED_KEEP = int(os.getenv("BASE_CHANGE_FEED_KEEP", 100000))
+POLLER = None
+WRITER = None
 DATA = {}
+INDEXES = {}
+SORTED_INDEXES = {}
+COLUMNS = {}
+JOURNALS = {}
+SHARD_MEMBERS = {}
+DIRTY_SHARDS = {}
+STATS = {}
+LOCKS = {}
+PERSIST_LOCKS = {}
+VERSIONS = {}
+FEED_STATE = {}
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMP_SLOTS = {'_created_at': 'created_at', '_updated_at': 'updated_at'}
+INTERNAL_SLOTS = ('__dict__', '__weakref__', '_json_cache')
+AFTER_ALL_IDS = '\U0010ffff'
+_MISSING = object()
+
+
+def to_epoch(value: datetime) -> int:
+    """ Convert a naive UTC datetime to epoch seconds
+    """
+    return (value - EPOCH) // timedelta(seconds=1)
+
+
+def from_epoch(value: int) -> datetime:
+    """ Convert epoch seconds to a naive UTC datetime
+    """
+    return EPOCH + timedelta(seconds=value)
 
 
 class Base():
     """ Base class
+    Declared attributes live in __slots__ and timestamps are kept as
+    epoch seconds; any other attribute still goes to __dict__.
+    to_json results are cached until an attribute is assigned
     """
 
+    __slots__ = ('id', '_created_at', '_updated_at', '_json_cache',
+                 '__dict__')
+    INDEXED_ATTRIBUTES = ()
+    SORTED_ATTRIBUTES = ('created_at', 'updated_at')
+    CATEGORY_COLUMNS = {}
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
-            DATA[s_class] = {}
+            DATA[s_class] = LazyStore(self.__class__)
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
-        else:
+        created_at = kwargs.get('created_at')
+        if created_at is None:
             self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
         else:
+            self._created_at = timestamp_to_int(created_at)
+        updated_at = kwargs.get('updated_at')
+        if updated_at is None:
             self.updated_at = datetime.utcnow()
+        else:
+            self._updated_at = timestamp_to_int(updated_at)
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict]) -> List[TypeVar('Base')]:
+        """ Build one object per JSON dictionary without calling
+        __init__: declared attributes are copied from the dictionary
+        (None when missing), like Base and User do in __init__.
+        Subclasses whose __init__ does more must override it
+        """
+        fields = tuple(name for name in cls.field_names()
+                       if name not in ('id', 'created_at', 'updated_at'))
+        new = cls.__new__
+        setter = object.__setattr__
+        timestamps = {}
+        now = None
+        objs = []
+        for record in records:
+            obj = new(cls)
+            obj_id = record.get('id')
+            if obj_id is None:
+                obj_id = str(uuid.uuid4())
+            setter(obj, 'id', obj_id)
+            for key, slot in (('created_at', '_created_at'),
+                              ('updated_at', '_updated_at')):
+                value = record.get(key)
+                if value is None:
+                    if now is None:
+                        now = to_epoch(datetime.utcnow())
+                    epoch = now
+                else:
+                    epoch = timestamps.get(value)
+                    if epoch is None:
+                        epoch = timestamps[value] = timestamp_to_int(value)
+                setter(obj, slot, epoch)
+            for name in fields:
+                setter(obj, name, record.get(name))
+            objs.append(obj)
+        return objs
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, keeping the secondary indexes up to date
+        and dropping the cached to_json results
+        """
+        if (name not in self.INDEXED_ATTRIBUTES and
+                name not in self.SORTED_ATTRIBUTES) or \
+                not self._is_stored():
+            object.__setattr__(self, name, value)
+        else:
+            cls = self.__class__
+            with cls.lock().write():
+                cls._index_attribute(self, name, False)
+                object.__setattr__(self, name, value)
+                cls._index_attribute(self, name)
+        object.__setattr__(self, '_json_cache', None)
+
+    @property
+    def created_at(self) -> datetime:
+        """ Getter of the creation date
+        """
+        return from_epoch(self._created_at)
+
+    @created_at.setter
+    def created_at(self, value: datetime):
+        """ Setter of the creation date, stored as epoch seconds
+        """
+        self._created_at = to_epoch(value)
+
+    @property
+    def updated_at(self) -> datetime:
+        """ Getter of the update date
+        """
+        return from_epoch(self._updated_at)
+
+    @updated_at.setter
+    def updated_at(self, value: datetime):
+        """ Setter of the update date, stored as epoch seconds
+        """
+        self._updated_at = to_epoch(value)
+
+    @classmethod
+    def field_names(cls) -> tuple:
+        """ Names of the declared attributes of the class, in order
+        """
+        names = cls.__dict__.get('_field_names')
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                for slot in klass.__dict__.get('__slots__', ()):
+                    if slot not in INTERNAL_SLOTS:
+                        names.append(TIMESTAMP_SLOTS.get(slot, slot))
+            names = tuple(names)
+            cls._field_names = names
+        return names
+
+    @classmethod
+    def lock(cls) -> RWLock:
+        """ Return the readers/writer lock guarding the objects and
+        indexes of the class
+        """
+        s_class = cls.__name__
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            lock = LOCKS.setdefault(s_class, RWLock())
+        return lock
+
+    @classmethod
+    def _persist_lock(cls, shard: int = 0) -> threading.Lock:
+        """ Return the lock letting one thread at a time write the
+        snapshot file of one shard of the class
+        """
+        key = (cls.__name__, shard)
+        lock = PERSIST_LOCKS.get(key)
+        if lock is None:
+            lock = PERSIST_LOCKS.setdefault(key, threading.Lock())
+        return lock
+
+    @classmethod
+    def _versions(cls) -> dict:
+        """ Return the number of changes of the class and, per shard,
+        the number of them already in the snapshot file
+        """
+        s_class = cls.__name__
+        versions = VERSIONS.get(s_class)
+        if versions is None:
+            versions = VERSIONS.setdefault(s_class,
+                                           {'changes': 0, 'written': {}})
+        return versions
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -46,9 +250,37 @@ class Base():
 
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+        The result is built once and a copy of it is returned until an
+        attribute is assigned: values mutated in place (a list attribute
+        for instance) are not seen
+        """
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = [None, None]
+            object.__setattr__(self, '_json_cache', cache)
+        variant = 1 if for_serialization else 0
+        result = cache[variant]
+        if result is None:
+            result = cache[variant] = self._build_json(for_serialization)
+        return result.copy()
+
+    def _build_json(self, for_serialization: bool) -> dict:
+        """ Build the JSON dictionary of the object
         """
         result = {}
-        for key, value in self.__dict__.items():
+        for key in self.field_names():
+            if not for_serialization and key[0] == '_':
+                continue
+            if key in ('created_at', 'updated_at'):
+                value = getattr(self, '_' + key, _MISSING)
+                if value is not _MISSING:
+                    result[key] = time.strftime(TIMESTAMP_FORMAT,
+                                                time.gmtime(value))
+                continue
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                result[key] = value
+        for key, value in getattr(self, '__dict__', {}).items():
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -58,55 +290,537 @@ class Base():
         return result
 
     @classmethod
-    def load_from_file(cls):
-        """ Load all objects from file
+    def load_from_file(cls, progress: Callable = None):
+        """ Load all objects from the storage backend
+        Parameters:
+            progress: called with (characters or bytes read, file size)
+        """
+        STORAGE.load(cls, progress)
+
+    @classmethod
+    def _index(cls, attribute: str) -> dict:
+        """ Return the index of attribute: value -> {id: None}
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            INDEXES[s_class] = {}
+        if INDEXES[s_class].get(attribute) is None:
+            INDEXES[s_class][attribute] = {}
+        return INDEXES[s_class][attribute]
+
+    @classmethod
+    def _index_value(cls, attribute: str, obj_id: str, value,
+                     add: bool = True):
+        """ Add (or remove) obj_id under value in the index of attribute
+        """
+        index = cls._index(attribute)
+        try:
+            bucket = index.get(value)
+        except TypeError:
+            return
+        if add:
+            if bucket is None:
+                bucket = index[value] = {}
+            bucket[obj_id] = None
+        elif bucket is not None and obj_id in bucket:
+            del bucket[obj_id]
+            if len(bucket) == 0:
+                del index[value]
+
+    @classmethod
+    def _index_entry(cls, obj_id: str, entry, add: bool = True):
+        """ Add (or remove) a stored entry, object or raw record, to
+        every index of the class
+        """
+        if entry is PAGED_OUT:
+            entry = resolve(DATA[cls.__name__], obj_id, entry)
+        for attribute in cls.INDEXED_ATTRIBUTES:
+            if is_raw(entry):
+                value = raw_get(entry, attribute)
+            else:
+                value = getattr(entry, attribute, None)
+            cls._index_value(attribute, obj_id, value, add)
+        for attribute in cls.SORTED_ATTRIBUTES:
+            cls._sorted_value(attribute, obj_id,
+                              cls._entry_value(entry, attribute), add)
+        if SHARD_COUNT > 1:
+            members = cls._shard_members(cls._shard(obj_id))
+            if add:
+                members[obj_id] = None
+            else:
+                members.pop(obj_id, None)
+        columns = COLUMNS.get(cls.__name__)
+        if columns is not None:
+            cls._column_entry(columns, obj_id, entry, add)
+
+    @classmethod
+    def _index_attribute(cls, obj: TypeVar('Base'), attribute: str,
+                         add: bool = True):
+        """ Add (or remove) the current value of one attribute of a
+        stored object to its indexes
+        """
+        if attribute in cls.INDEXED_ATTRIBUTES:
+            cls._index_value(attribute, obj.id,
+                             getattr(obj, attribute, None), add)
+        if attribute in cls.SORTED_ATTRIBUTES:
+            cls._sorted_value(attribute, obj.id,
+                              attribute_value(obj, attribute), add)
+
+    @classmethod
+    def _entry_value(cls, entry, attribute: str):
+        """ Return the value of attribute of a stored entry, object or
+        raw record, as kept in the sorted indexes: epoch seconds for the
+        timestamps, strings for the others (None for anything else)
+        """
+        if is_raw(entry):
+            value = to_value(attribute, raw_get(entry, attribute))
+        else:
+            value = attribute_value(entry, attribute)
+        if attribute in TIMESTAMP_KEYS:
+            return value if type(value) is int else None
+        return value if type(value) is str else None
+
+    @classmethod
+    def _sorted_index(cls, attribute: str) -> list:
+        """ Return the sorted index of attribute, a list of (value, id)
+        in ascending order built from DATA on first use, must be called
+        with the lock held. None values are not indexed
+        """
+        s_class = cls.__name__
+        indexes = SORTED_INDEXES.get(s_class)
+        if indexes is None:
+            indexes = SORTED_INDEXES.setdefault(s_class, {})
+        index = indexes.get(attribute)
+        if index is None:
+            index = []
+            store = DATA.get(s_class, {})
+            for obj_id, entry in dict.items(store):
+                value = cls._entry_value(resolve(store, obj_id, entry),
+                                         attribute)
+                if value is not None:
+                    index.append((value, obj_id))
+            index.sort()
+            indexes[attribute] = index
+        return index
+
+    @classmethod
+    def _sorted_value(cls, attribute: str, obj_id: str, value,
+                      add: bool = True):
+        """ Add (or remove) obj_id under value in the sorted index of
+        attribute, if it is built
+        """
+        index = SORTED_INDEXES.get(cls.__name__, {}).get(attribute)
+        if index is None or value is None:
+            return
+        key = (value, obj_id)
+        try:
+            i = bisect_left(index, key)
+        except TypeError:
+            return
+        present = i < len(index) and index[i] == key
+        if add and not present:
+            index.insert(i, key)
+        elif not add and present:
+            del index[i]
+
+    @classmethod
+    def _columns(cls) -> Columns:
+        """ Return the column arrays of the class, built from DATA on
+        first use, must be called with the write lock held
+        """
+        s_class = cls.__name__
+        columns = COLUMNS.get(s_class)
+        if columns is None:
+            columns = Columns(tuple(cls.CATEGORY_COLUMNS),
+                              max(len(DATA.get(s_class, {})), 1))
+            store = DATA.get(s_class, {})
+            for obj_id, entry in dict.items(store):
+                cls._column_entry(columns, obj_id,
+                                  resolve(store, obj_id, entry))
+            COLUMNS[s_class] = columns
+        return columns
+
+    @classmethod
+    def _column_entry(cls, columns: Columns, obj_id: str, entry,
+                      add: bool = True):
+        """ Set (or remove) the row of a stored entry, object or raw
+        record, in columns
+        """
+        if not add:
+            columns.discard(obj_id)
+            return
+        if is_raw(entry):
+            categories = categorize(cls.CATEGORY_COLUMNS,
+                                    lambda name: raw_get(entry, name))
+        else:
+            categories = categorize(cls.CATEGORY_COLUMNS,
+                                    lambda name: getattr(entry, name, None))
+        columns.set(obj_id, cls._entry_value(entry, 'created_at'),
+                    cls._entry_value(entry, 'updated_at'), categories)
+
+    @classmethod
+    def _sorted_range(cls, attribute: str, conditions: list) -> List[str]:
+        """ Return the ids meeting the conditions on attribute, in the
+        order of its sorted index, or None if the index can not answer
+        """
+        index = cls._sorted_index(attribute)
+        kind = int if attribute in TIMESTAMP_KEYS else str
+        lo, hi = 0, len(index)
+        for _, op, value in conditions:
+            if type(value) is not kind:
+                return None
+            if op in ('eq', 'gte', 'startswith'):
+                lo = max(lo, bisect_left(index, (value,)))
+            elif op == 'gt':
+                lo = max(lo, bisect_right(index, (value, AFTER_ALL_IDS)))
+            if op in ('eq', 'lte'):
+                hi = min(hi, bisect_right(index, (value, AFTER_ALL_IDS)))
+            elif op == 'lt':
+                hi = min(hi, bisect_left(index, (value,)))
+            elif op == 'startswith':
+                end = prefix_end(value)
+                if end is not None:
+                    hi = min(hi, bisect_left(index, (end,)))
+        return [obj_id for _, obj_id in index[lo:hi]]
+
+    @classmethod
+    def _rebuild_indexes(cls):
+        """ Rebuild every secondary index of the class from DATA,
+        without building the objects
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {}
+        SORTED_INDEXES[s_class] = {}
+        COLUMNS[s_class] = None
+        SHARD_MEMBERS[s_class] = None
+        for attribute in cls.INDEXED_ATTRIBUTES:
+            cls._index(attribute)
+        for obj_id, entry in dict.items(DATA[s_class]):
+            cls._index_entry(obj_id, entry)
+
+    def _is_stored(self) -> bool:
+        """ True if this very object is the one stored in DATA
+        """
+        obj_id = getattr(self, 'id', None)
+        if obj_id is None:
+            return False
+        store = DATA.get(self.__class__.__name__, {})
+        return dict.get(store, obj_id) is self
+
+    @classmethod
+    def save_to_file(cls, version: int = None, shard_numbers=None):
+        """ Save all objects to file, one thread at a time per shard.
+        The objects are copied once the file lock is held, so the last
+        write always holds the latest state
+        Parameters:
+            version: change to persist, nothing is written if another
+                thread already wrote it
+            shard_numbers: shards to write, all of them by default
+        """
+        if shard_numbers is None:
+            shard_numbers = range(SHARD_COUNT)
+        versions = cls._versions()
+        for shard in shard_numbers:
+            with cls._persist_lock(shard):
+                if version is not None and \
+                        versions['written'].get(shard, 0) >= version:
+                    continue
+                with cls.lock().read():
+                    written = versions['changes']
+                    objs = cls._shard_objects(shard)
+                content = snapshot.dumps(objs, SNAPSHOT_FORMAT)
+                n_bytes = write_atomic(cls.snapshot_path(shard), content,
+                                       FSYNC_POLICY)
+                cls.journal(shard).clear()
+                versions['written'][shard] = written
+            cls._count_write(n_bytes)
+
+    @classmethod
+    def snapshot_path(cls, shard: int = 0) -> str:
+        """ Return the snapshot file of one shard of the class in
+        SNAPSHOT_FORMAT
+        """
+        return shards.file_path(cls.__name__,
+                                snapshot.EXTENSIONS[SNAPSHOT_FORMAT],
+                                SHARD_COUNT, shard)
+
+    @classmethod
+    def _shard(cls, obj_id: str) -> int:
+        """ Return the shard of obj_id
+        """
+        return shards.shard_of(obj_id, SHARD_COUNT)
+
+    @classmethod
+    def _shard_members(cls, shard: int) -> dict:
+        """ Return the ids of one shard as {id: None}, built from DATA
+        on first use
+        """
+        s_class = cls.__name__
+        members = SHARD_MEMBERS.get(s_class)
+        if members is None:
+            members = [{} for _ in range(SHARD_COUNT)]
+            for obj_id in dict.keys(DATA.get(s_class, {})):
+                members[cls._shard(obj_id)][obj_id] = None
+            SHARD_MEMBERS[s_class] = members
+        return members[shard]
+
+    @classmethod
+    def _shard_objects(cls, shard: int) -> dict:
+        """ Return a shallow copy of the objects of one shard, must be
+        called with the lock held
+        """
+        store = DATA[cls.__name__]
+        if SHARD_COUNT == 1:
+            return store.copy()
+        return store.copy(cls._shard_members(shard))
+
+    @classmethod
+    def _take_dirty_shards(cls) -> list:
+        """ Return and forget the shards changed since the last call
+        """
+        with cls.lock().write():
+            dirty = DIRTY_SHARDS.pop(cls.__name__, set())
+        return sorted(dirty)
+
+    @classmethod
+    def writer(cls) -> DeferredWriter:
+        """ Return the background writer of the deferred mode, flushed
+        at interpreter exit
+        """
+        global WRITER
+        if WRITER is None:
+            WRITER = DeferredWriter(
+                lambda klass: klass.save_to_file(
+                    shard_numbers=klass._take_dirty_shards()),
+                FLUSH_INTERVAL, FLUSH_CHANGES)
+            atexit.register(WRITER.stop)
+        return WRITER
+
+    @classmethod
+    def flush(cls):
+        """ Make every save and remove of the class durable now
+        """
+        if WRITER is not None:
+            WRITER.flush(cls)
+        for journal in cls.journals():
+            journal.sync()
+
+    @classmethod
+    def _persist(cls, op: str, obj: TypeVar('Base')) -> int:
+        """ Record one save or remove according to STORAGE_MODE, must be
+        called with the write lock held. The snapshot mode writes the
+        file later, outside of the lock
+        Return:
+            version of the change
+        """
+        versions = cls._versions()
+        versions['changes'] += 1
+        cls._publish(op, obj)
+        if STORAGE_MODE == 'journal':
+            obj_json = obj.to_json(True) if op == 'save' else None
+            cls._append_to_journal(op, obj.id, obj_json)
+        elif STORAGE_MODE == 'deferred':
+            DIRTY_SHARDS.setdefault(cls.__name__, set()).add(
+                cls._shard(obj.id))
+            cls.writer().mark(cls)
+        return versions['changes']
+
+    @classmethod
+    def _feed_state(cls) -> dict:
+        """ Return the last change feed version applied to the class
+        and the versions of its objects published by this process since
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        state = FEED_STATE.get(s_class)
+        if state is None:
+            state = FEED_STATE.setdefault(
+                s_class, {'cls': cls, 'applied': 0, 'pending': {},
+                          'reloads': 0})
+        return state
+
+    @classmethod
+    def _publish(cls, op: str, obj: TypeVar('Base')):
+        """ Publish one save or remove to the change feed if enabled,
+        must be called with the write lock held
+        """
+        if FEED is None:
             return
+        obj_json = obj.to_json(True) if op == 'save' else None
+        version = FEED.publish(cls.__name__, obj.id, op, obj_json)
+        cls._feed_state()['pending'][obj.id] = version
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def changes(cls, since: int = 0, limit: int = None) -> List[Change]:
+        """ Return the changes of the class published by any process
+        after version since, oldest first (none without change feed)
+        Raise:
+            FeedGapError if some of them were trimmed from the feed
+        """
+        if FEED is None:
+            return []
+        return FEED.since(since, cls.__name__, limit)
+
+    @classmethod
+    def sync_changes(cls) -> int:
+        """ Apply to DATA the changes of the class published by other
+        processes since the last call, without reloading the file. If
+        the feed no longer keeps all of them, the class is reloaded
+        Return:
+            number of changes applied (0 after a reload)
+        """
+        if FEED is None:
+            return 0
+        state = cls._feed_state()
+        last = FEED.last_version()
+        try:
+            changes = FEED.since(state['applied'], cls.__name__)
+        except FeedGapError:
+            state['reloads'] += 1
+            cls.load_from_file()
+            return 0
+        if not changes and last <= state['applied']:
+            return 0
+        with cls.lock().write():
+            return cls._apply_changes(changes, last)
 
     @classmethod
-    def save_to_file(cls):
-        """ Save all objects to file
+    def _apply_changes(cls, changes: List[Change], upto: int = 0) -> int:
+        """ Apply changes to DATA and the indexes, must be called with
+        the write lock held. A change older than the last one published
+        by this process for the same object is skipped
+        Parameters:
+            upto: version (of any class) up to which changes holds every
+                change of the class, so the next ones are asked after it
+        Return:
+            number of changes applied
+        """
+        store = DATA[cls.__name__]
+        state = cls._feed_state()
+        pending = state['pending']
+        applied = 0
+        for change in changes:
+            if change.version <= state['applied']:
+                continue
+            state['applied'] = change.version
+            if change.version <= pending.get(change.id, 0):
+                continue
+            stored = dict.get(store, change.id)
+            if stored is not None:
+                cls._index_entry(change.id, stored, False)
+            if change.op == 'save':
+                raw = to_raw(change.data)
+                store[change.id] = raw
+                cls._index_entry(change.id, raw)
+            elif stored is not None:
+                del store[change.id]
+            applied += 1
+        state['applied'] = max(state['applied'], upto)
+        for obj_id, version in list(pending.items()):
+            if version <= state['applied']:
+                del pending[obj_id]
+        return applied
+
+    @classmethod
+    def journal(cls, shard: int = 0) -> Journal:
+        """ Return the journal of one shard of the class
+        """
+        file_path = shards.file_path(cls.__name__, "journal", SHARD_COUNT,
+                                     shard)
+        if JOURNALS.get(file_path) is None:
+            JOURNALS[file_path] = Journal(file_path, FSYNC_POLICY != 'none')
+        return JOURNALS[file_path]
+
+    @classmethod
+    def journals(cls) -> List[Journal]:
+        """ Return the journals of every shard of the class
+        """
+        return [cls.journal(shard) for shard in range(SHARD_COUNT)]
+
+    @classmethod
+    def _stats(cls) -> dict:
+        """ Return the storage counters of the class
+        """
+        s_class = cls.__name__
+        if STATS.get(s_class) is None:
+            STATS[s_class] = {'writes': 0, 'bytes_written': 0, 'load': None}
+        return STATS[s_class]
+
+    @classmethod
+    def _count_write(cls, n_bytes: int):
+        """ Account n_bytes written for one save or remove
+        """
+        stats = cls._stats()
+        stats['writes'] += 1
+        stats['bytes_written'] += n_bytes
+
+    @classmethod
+    def storage_stats(cls) -> dict:
+        """ Return the number of writes, bytes written and bytes per
+        write of the class, with the last load duration, the number
+        of objects built so far, the paging counters and the change
+        feed version applied
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        stats = dict(cls._stats())
+        stats['bytes_per_write'] = stats['bytes_written'] / stats['writes'] \
+            if stats['writes'] else 0
+        stats['backend'] = STORAGE.name
+        stats['mode'] = STORAGE_MODE
+        stats['shards'] = SHARD_COUNT
+        stats['journal'] = {}
+        for journal in cls.journals():
+            for key, value in journal.stats.items():
+                stats['journal'][key] = stats['journal'].get(key, 0) + value
+        if WRITER is not None:
+            stats['writer'] = dict(WRITER.stats)
+        store = DATA.get(s_class)
+        if isinstance(store, LazyStore):
+            stats['hydrated'] = store.hydrated_count()
+            if store.pager is not None:
+                stats['paging'] = store.pager.snapshot_stats()
+        if FEED is not None:
+            state = cls._feed_state()
+            stats['feed'] = {'applied': state['applied'],
+                             'pending': len(state['pending']),
+                             'reloads': state['reloads']}
+            if POLLER is not None:
+                stats['feed'].update(POLLER.stats)
+        return stats
+
+    @classmethod
+    def _append_to_journal(cls, op: str, obj_id: str, obj_json: dict = None):
+        """ Append a save or remove to the journal, starting a background
+        compaction once the journal is larger than JOURNAL_COMPACT_BYTES
+        """
+        shard = cls._shard(obj_id)
+        journal = cls.journal(shard)
+        cls._count_write(journal.append(op, obj_id, obj_json))
+        if journal.size() > JOURNAL_COMPACT_BYTES:
+            file_path = cls.snapshot_path(shard)
+
+            def _write_snapshot(objs):
+                write_atomic(file_path, snapshot.dumps(objs, SNAPSHOT_FORMAT),
+                             FSYNC_POLICY)
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+            journal.compact(lambda: cls._shard_objects(shard),
+                            _write_snapshot)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        STORAGE.save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        STORAGE.remove(self)
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return STORAGE.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -118,20 +832,345 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return STORAGE.get(cls, id)
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
+    def search(cls, attributes: dict = None) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
+        if attributes is None:
+            attributes = {}
+        return STORAGE.search(cls, attributes)
+
+    @classmethod
+    def query(cls, filters: dict = None, order_by: str = None,
+              limit: int = None, offset: int = 0) -> List[TypeVar('Base')]:
+        """ Return the objects matching filters, see iter_query
+        """
+        return list(cls.iter_query(filters, order_by, limit, offset))
+
+    @classmethod
+    def iter_query(cls, filters: dict = None, order_by: str = None,
+                   limit: int = None,
+                   offset: int = 0) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects matching filters, stopping as soon
+        as limit objects are found
+        Parameters:
+            filters: {attribute[__op]: value}, op being gt, gte, lt, lte,
+                startswith or eq (the default). Timestamps may be given
+                as datetime, string or epoch seconds
+            order_by: attribute to sort on, descending if prefixed by -
+            limit: maximum number of objects
+            offset: number of matching objects skipped
+        """
+        return STORAGE.query(cls, parse_filters(filters), order_by, limit,
+                             offset)
+
+    @classmethod
+    def columns(cls) -> Columns:
+        """ Return a copy of the column arrays of the class, answering
+        histograms and group counts on created_at, updated_at and the
+        CATEGORY_COLUMNS without building any object
+        """
+        return STORAGE.columns(cls)
+
+
+class MemoryStorage(Storage):
+    """ Storage keeping every object in DATA, persisted in snapshot
+    files according to STORAGE_MODE
+    """
+
+    name = 'memory'
+
+    def load(self, cls, progress: Callable = None):
+        """ Load all objects from file, then replay the journal.
+        The file is parsed as a stream and objects are kept as raw
+        records, only built when first read. Several shards are loaded
+        in parallel by up to LOAD_WORKERS processes. With a paging
+        budget, the records go to the file of the pager instead.
+        With a change feed, the changes it keeps are applied last (the
+        ones it trimmed being in the files) and new ones every
+        CHANGE_FEED_POLL seconds
+        Raise:
+            ValueError if files of the class are split in another
+            number of shards than SHARD_COUNT, or snapshots of the class
+            are in another format than SNAPSHOT_FORMAT
+        """
+        s_class = cls.__name__
+        foreign = shards.foreign_files(s_class, SHARD_COUNT)
+        if foreign:
+            raise ValueError(
+                "{} not split in BASE_SHARDS={} shards: run "
+                "reshard.py {} {} first".format(", ".join(foreign),
+                                                SHARD_COUNT, s_class,
+                                                SHARD_COUNT))
+        other_format = [p for fmt, ext in snapshot.EXTENSIONS.items()
+                        if fmt != SNAPSHOT_FORMAT
+                        for p in shards.existing_files(s_class, ext)]
+        if other_format:
+            if SHARD_COUNT == 1:
+                command = "convert_snapshot.py {} {} -f {} then remove " \
+                          "{}".format(other_format[0], cls.snapshot_path(),
+                                      SNAPSHOT_FORMAT, other_format[0])
+            else:
+                command = "reshard.py {} {} -f {}".format(
+                    s_class, SHARD_COUNT, SNAPSHOT_FORMAT)
+            raise ValueError(
+                "{} not in BASE_SNAPSHOT_FORMAT={}: run {}".format(
+                    ", ".join(other_format), SNAPSHOT_FORMAT, command))
+        file_paths = [cls.snapshot_path(shard)
+                      for shard in range(SHARD_COUNT)]
+        file_paths = [p for p in file_paths if path.exists(p)]
+        started = time.perf_counter()
+        with cls.lock().write():
+            previous = DATA.get(s_class)
+            if isinstance(previous, LazyStore) and \
+                    previous.pager is not None:
+                previous.pager.close()
+            DATA[s_class] = LazyStore(cls, pager=self._pager(cls))
+            INDEXES[s_class] = {}
+            size = sum(path.getsize(p) for p in file_paths)
+            if len(file_paths) == 1:
+                report = None
+                if progress is not None:
+                    def report(read):
+                        progress(read, size)
+                for obj_id, raw in snapshot.load(file_paths[0], report):
+                    DATA[s_class][obj_id] = raw
+            elif file_paths:
+                self._load_parallel(DATA[s_class], file_paths, size,
+                                    progress)
+
+            for journal in cls.journals():
+                for op, obj_id, obj_json in journal.replay():
+                    if op == 'save':
+                        DATA[s_class][obj_id] = to_raw(obj_json)
+                    else:
+                        DATA[s_class].pop(obj_id, None)
+            if FEED is not None:
+                state = cls._feed_state()
+                state['applied'] = 0
+                state['pending'] = {}
+                last = FEED.last_version()
+                cls._apply_changes(FEED.kept(s_class), last)
+            cls._rebuild_indexes()
+            cls._stats()['load'] = {
+                'records': len(DATA[s_class]),
+                'bytes': size,
+                'seconds': time.perf_counter() - started,
+            }
+        if FEED is not None:
+            start_poller()
+
+    def _pager(self, cls) -> Pager:
+        """ Return a new pager for the objects of cls if HOT_OBJECTS or
+        HOT_BYTES set a budget, else None. Its file is removed at exit
+        """
+        if not HOT_OBJECTS and not HOT_BYTES:
+            return None
+        pager = Pager(path.join(PAGING_DIR, "db_{}.{}.pages".format(
+            cls.__name__, os.getpid())), HOT_OBJECTS, HOT_BYTES)
+        atexit.register(pager.close)
+        return pager
+
+    def _load_parallel(self, store: LazyStore, file_paths: List[str],
+                       size: int, progress: Callable = None):
+        """ Load the shard files in a pool of worker processes
+        """
+        read = 0
+        workers = min(LOAD_WORKERS, len(file_paths))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(shards.load_file, file_paths)
+                for file_path, records in zip(file_paths, results):
+                    for obj_id, raw in records:
+                        store[obj_id] = (shared_layout(raw[0]), raw[1])
+                    read += path.getsize(file_path)
+                    if progress is not None:
+                        progress(read, size)
+            return
+        for file_path in file_paths:
+            for obj_id, raw in snapshot.load(file_path):
+                store[obj_id] = raw
+            read += path.getsize(file_path)
+            if progress is not None:
+                progress(read, size)
+
+    def save(self, obj: Base):
+        """ Store obj and persist the change
+        """
+        cls = obj.__class__
+        s_class = cls.__name__
+        with cls.lock().write():
+            stored = dict.get(DATA[s_class], obj.id)
+            if stored is not None and stored is not obj:
+                cls._index_entry(obj.id, stored, False)
+            DATA[s_class][obj.id] = obj
+            cls._index_entry(obj.id, obj)
+            version = cls._persist('save', obj)
+        if STORAGE_MODE not in ('journal', 'deferred'):
+            cls.save_to_file(version, [cls._shard(obj.id)])
+
+    def remove(self, obj: Base):
+        """ Remove obj and persist the change
+        """
+        cls = obj.__class__
+        s_class = cls.__name__
+        with cls.lock().write():
+            stored = dict.get(DATA[s_class], obj.id)
+            if stored is None:
+                return
+            cls._index_entry(obj.id, stored, False)
+            del DATA[s_class][obj.id]
+            version = cls._persist('remove', obj)
+        if STORAGE_MODE not in ('journal', 'deferred'):
+            cls.save_to_file(version, [cls._shard(obj.id)])
+
+    def count(self, cls) -> int:
+        """ Count all objects of cls
+        """
+        s_class = cls.__name__
+        with cls.lock().read():
+            return len(DATA[s_class].keys())
+
+    def get(self, cls, obj_id: str) -> Base:
+        """ Return one object of cls by ID
+        """
+        s_class = cls.__name__
+        with cls.lock().read():
+            return DATA[s_class].get(obj_id)
+
+    def search(self, cls, attributes: dict) -> List[Base]:
+        """ Search all objects of cls with matching attributes, through
+        the secondary indexes when all attributes are indexed
+        """
         s_class = cls.__name__
-        def _search(obj):
-            if len(attributes) == 0:
+        with cls.lock().read():
+            if len(attributes) > 0 and \
+                    all(k in cls.INDEXED_ATTRIBUTES for k in attributes):
+                try:
+                    buckets = [cls._index(k).get(v, {})
+                               for k, v in attributes.items()]
+                except TypeError:
+                    buckets = None
+                if buckets is not None:
+                    candidates = min(buckets, key=len)
+                    objs = [DATA[s_class][obj_id]
+                            for obj_id in list(candidates)]
+                    return [obj for obj in objs
+                            if all(getattr(obj, k) == v
+                                   for k, v in attributes.items())]
+
+            def _search(obj):
+                if len(attributes) == 0:
+                    return True
+                for k, v in attributes.items():
+                    if (getattr(obj, k) != v):
+                        return False
                 return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+            DATA[s_class].hydrate_all()
+            return list(filter(_search, DATA[s_class].values()))
+
+    def query(self, cls, conditions: list, order_by: str = None,
+              limit: int = None, offset: int = 0) -> Iterator[Base]:
+        """ Iterate over the objects of cls meeting conditions. The ids
+        to test come from the smallest hash bucket or sorted index range
+        of the conditions, else from the sorted index of order_by, else
+        from every object; they are copied under the read lock and the
+        objects built and tested one by one while iterating
+        """
+        s_class = cls.__name__
+        descending = order_by is not None and order_by[0] == '-'
+        order_attribute = order_by.lstrip('-') if order_by else None
+        with cls.lock().read():
+            ids, sorted_on = self._candidates(cls, conditions,
+                                              order_attribute)
+        if order_attribute is not None and sorted_on == order_attribute \
+                and descending:
+            ids.reverse()
+        store = DATA[s_class]
+        objs = (store.get(obj_id) for obj_id in ids)
+        objs = (obj for obj in objs
+                if obj is not None and matches(obj, conditions))
+        if order_attribute is not None and sorted_on != order_attribute:
+            objs = iter(sorted(objs, key=sort_key(order_attribute),
+                               reverse=descending))
+        stop = None if limit is None else offset + limit
+        return islice(objs, offset, stop)
+
+    def columns(self, cls) -> Columns:
+        """ Return a copy of the column arrays of cls, kept up to date
+        by save and remove once built
+        """
+        s_class = cls.__name__
+        with cls.lock().read():
+            columns = COLUMNS.get(s_class)
+            if columns is not None:
+                return columns.copy()
+        with cls.lock().write():
+            return cls._columns().copy()
+
+    def _candidates(self, cls, conditions: list, order_attribute: str):
+        """ Return the ids to test and the attribute they are sorted on
+        (None if unsorted), must be called with the lock held
+        """
+        s_class = cls.__name__
+        best = None
+        by_attribute = {}
+        for condition in conditions:
+            by_attribute.setdefault(condition.attribute, []).append(condition)
+        for attribute, attribute_conditions in by_attribute.items():
+            candidates = []
+            if attribute in cls.INDEXED_ATTRIBUTES:
+                for _, op, value in attribute_conditions:
+                    if op != 'eq':
+                        continue
+                    try:
+                        candidates.append((list(cls._index(attribute).get(
+                            value, {})), None))
+                    except TypeError:
+                        pass
+            if attribute in cls.SORTED_ATTRIBUTES:
+                ids = cls._sorted_range(attribute, attribute_conditions)
+                if ids is not None:
+                    candidates.append((ids, attribute))
+            for candidate in candidates:
+                if best is None or len(candidate[0]) < len(best[0]):
+                    best = candidate
+        if best is None and order_attribute in cls.SORTED_ATTRIBUTES:
+            index = cls._sorted_index(order_attribute)
+            if len(index) == len(DATA[s_class]):
+                best = ([obj_id for _, obj_id in index], order_attribute)
+        if best is None:
+            best = (list(dict.keys(DATA[s_class])), None)
+        return best
+
+
+def sync_changes() -> int:
+    """ Apply the new changes of the change feed to every class using
+    it in this process
+    Return:
+        number of changes applied
+    """
+    return sum(state['cls'].sync_changes()
+               for state in list(FEED_STATE.values()))
+
+
+def start_poller():
+    """ Start the thread applying the change feed every
+    CHANGE_FEED_POLL seconds if it is not running, stopped at exit
+    """
+    global POLLER
+    if POLLER is None and CHANGE_FEED_POLL > 0:
+        POLLER = FeedPoller(sync_changes, CHANGE_FEED_POLL)
+        atexit.register(POLLER.stop)
+
+
+STORAGE_BACKENDS = {
+    'memory': lambda: MemoryStorage(),
+    'sqlite': lambda: SQLiteStorage(SQLITE_PATH),
+}
+STORAGE = STORAGE_BACKENDS[STORAGE_BACKEND]()
+FEED = ChangeFeed(CHANGE_FEED_PATH, CHANGE_FEED_KEEP) \
+    if CHANGE_FEED_PATH else None
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+""" Change feed module: saves and removes shared between processes
+"""
+import json
+import sqlite3
+import threading
+from collections import namedtuple
+from typing import Callable, List
+
+from models.sqlite_storage import BUSY_TIMEOUT
+
+
+Change = namedtuple('Change', ['version', 'cls', 'id', 'op', 'data'])
+TRIM_EVERY = 1000
+
+
+class FeedGapError(Exception):
+    """ Raised when some of the changes asked for were already trimmed
+    from the feed
+    """
+
+
+class ChangeFeed():
+    """ Log of the saves and removes of Base objects, an SQLite table
+    shared by every process using the same file. Versions increase
+    across processes and classes; only the last keep changes are kept
+    """
+
+    def __init__(self, file_path: str, keep: int = 100000):
+        """ Initialize a ChangeFeed on the database file_path
+        """
+        self.file_path = file_path
+        self.keep = keep
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "version INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "class TEXT NOT NULL, id TEXT NOT NULL, op TEXT NOT NULL, "
+                "data TEXT)")
+            connection.execute("CREATE INDEX IF NOT EXISTS changes_class "
+                               "ON changes (class, version)")
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path,
+                                         timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def publish(self, s_class: str, obj_id: str, op: str,
+                obj_json: dict = None) -> int:
+        """ Append one save (with the JSON dictionary of the object) or
+        remove, trimming the log every TRIM_EVERY changes
+        Return:
+            version of the change
+        """
+        data = json.dumps(obj_json) if obj_json is not None else None
+        connection = self.connection()
+        with connection:
+            version = connection.execute(
+                "INSERT INTO changes (class, id, op, data) "
+                "VALUES (?, ?, ?, ?)", (s_class, obj_id, op, data)).lastrowid
+            if version % TRIM_EVERY == 0:
+                connection.execute("DELETE FROM changes WHERE version <= ?",
+                                   (version - self.keep,))
+        return version
+
+    def since(self, version: int = 0, s_class: str = None,
+              limit: int = None) -> List[Change]:
+        """ Return the changes after version (of s_class only if given),
+        oldest first, at most limit of them
+        Raise:
+            FeedGapError if changes after version were trimmed
+        """
+        changes = self._select(version, s_class, limit)
+        # checked after the select: a trim in between is a false alarm,
+        # never a gap going unnoticed
+        first = self.first_version()
+        if first > version + 1:
+            raise FeedGapError("changes {} to {} were trimmed from {}".format(
+                version + 1, first - 1, self.file_path))
+        return changes
+
+    def kept(self, s_class: str = None) -> List[Change]:
+        """ Return every change kept (of s_class only if given), oldest
+        first
+        """
+        return self._select(0, s_class)
+
+    def _select(self, version: int, s_class: str = None,
+                limit: int = None) -> List[Change]:
+        """ Return the changes kept after version, see since
+        """
+        sql = "SELECT version, class, id, op, data FROM changes " \
+              "WHERE version > ?"
+        params = [version]
+        if s_class is not None:
+            sql += " AND class = ?"
+            params.append(s_class)
+        sql += " ORDER BY version"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [Change(v, c, i, op, json.loads(data) if data else None)
+                for v, c, i, op, data in
+                self.connection().execute(sql, params)]
+
+    def first_version(self) -> int:
+        """ Return the version of the oldest change kept, 0 if there is
+        none
+        """
+        return self.connection().execute(
+            "SELECT COALESCE(MIN(version), 0) FROM changes").fetchone()[0]
+
+    def last_version(self) -> int:
+        """ Return the version of the last change, 0 if there is none
+        """
+        return self.connection().execute(
+            "SELECT COALESCE(MAX(version), 0) FROM changes").fetchone()[0]
+
+
+class FeedPoller():
+    """ Background thread calling sync every interval seconds until
+    stopped
+    """
+
+    def __init__(self, sync: Callable, interval: float = 1.0):
+        """ Initialize and start a FeedPoller
+        """
+        self.sync = sync
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.stats = {'polls': 0, 'errors': 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """ Background loop, errors (a locked database for instance)
+        being retried at the next interval
+        """
+        while not self.stopping.wait(self.interval):
+            try:
+                self.sync()
+                self.stats['polls'] += 1
+            except Exception:
+                self.stats['errors'] += 1
+
+    def stop(self):
+        """ Stop the background thread
+        """
+        self.stopping.set()
+        self.thread.join()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+""" Journal module: append-only log of saves and removes
+"""
+import json
+import os
+import shutil
+import threading
+from typing import Callable, Iterator, Tuple
+
+
+class Journal():
+    """ Append-only journal of one class, stored next to its snapshot
+    as one JSON line per save or remove
+    """
+
+    def __init__(self, file_path: str, fsync: bool = False):
+        """ Initialize a Journal on file_path
+        Parameters:
+            file_path: path of the journal file
+            fsync: if True, every append is synced to disk
+        """
+        self.file_path = file_path
+        self.fsync = fsync
+        self.old_path = file_path + ".old"
+        self.lock = threading.Lock()
+        self.compacting = False
+        self._file = None
+        self._size = 0
+        self.stats = {'appends': 0, 'bytes_written': 0, 'last_bytes': 0,
+                      'compactions': 0}
+
+    def append(self, op: str, obj_id: str, data: dict = None) -> int:
+        """ Append one record and return the number of bytes written
+        """
+        line = json.dumps({'op': op, 'id': obj_id, 'data': data})
+        line = (line + "\n").encode('utf-8')
+        with self.lock:
+            if self._file is None:
+                self._file = open(self.file_path, 'ab')
+                self._size = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._size += len(line)
+            self.stats['appends'] += 1
+            self.stats['bytes_written'] += len(line)
+            self.stats['last_bytes'] = len(line)
+        return len(line)
+
+    def size(self) -> int:
+        """ Size in bytes of the current journal file
+        """
+        if self._file is not None:
+            return self._size
+        if not os.path.exists(self.file_path):
+            return 0
+        return os.path.getsize(self.file_path)
+
+    def replay(self) -> Iterator[Tuple[str, str, dict]]:
+        """ Yield (op, id, data) for every record of the rotated journal
+        (left by an interrupted compaction) then of the current one.
+        A truncated last line is ignored
+        """
+        for file_path in (self.old_path, self.file_path):
+            if not os.path.exists(file_path):
+                continue
+            with open(file_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    yield record['op'], record['id'], record.get('data')
+
+    def rotate(self):
+        """ Move the current journal aside so that new records go to a
+        fresh file, must be called with the lock held. A rotated journal
+        left by an interrupted compaction is kept and extended
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._size = 0
+        if not os.path.exists(self.file_path):
+            return
+        if not os.path.exists(self.old_path):
+            os.replace(self.file_path, self.old_path)
+            return
+        with open(self.old_path, 'ab+') as old, \
+                open(self.file_path, 'rb') as current:
+            if old.tell() > 0:
+                old.seek(-1, os.SEEK_END)
+                if old.read(1) != b"\n":
+                    old.write(b"\n")
+            shutil.copyfileobj(current, old)
+        os.remove(self.file_path)
+
+    def compact(self, snapshot: Callable, write_snapshot: Callable):
+        """ Fold the journal into a new snapshot in a background thread
+        Parameters:
+            snapshot: called with the lock held, returns the state to
+                persist (must be cheap: a shallow copy)
+            write_snapshot: called in the background with that state,
+                writes it as the new snapshot file
+        """
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+            self.rotate()
+            state = snapshot()
+
+        def _compact():
+            try:
+                write_snapshot(state)
+                if os.path.exists(self.old_path):
+                    os.remove(self.old_path)
+                self.stats['compactions'] += 1
+            finally:
+                self.compacting = False
+
+        thread = threading.Thread(target=_compact, daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        """ Remove the journal files, once they are folded in a snapshot
+        """
+        with self.lock:
+            self.rotate()
+            if os.path.exists(self.old_path):
+                os.remove(self.old_path)
+
+    def sync(self):
+        """ Sync the journal file to disk
+        """
+        with self.lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        """ Close the journal file
+        """
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+""" Shards module: objects of a class split in several files by id
+"""
+import glob
+import os
+import re
+import zlib
+from typing import Dict, List, Tuple
+
+from models import snapshot
+from models.journal import Journal
+from models.lazy_store import to_raw
+from models.writer import write_atomic
+
+
+def shard_of(obj_id: str, shards: int) -> int:
+    """ Return the shard of obj_id among shards, stable across runs
+    """
+    if shards == 1:
+        return 0
+    return zlib.crc32(obj_id.encode('utf-8')) % shards
+
+
+def file_path(s_class: str, extension: str, shards: int,
+              shard: int = 0) -> str:
+    """ Return the file of one shard of s_class: .db_<Class>.<ext> when
+    there is a single shard, .db_<Class>.<shard>.<ext> otherwise
+    """
+    if shards == 1:
+        return ".db_{}.{}".format(s_class, extension)
+    return ".db_{}.{}.{}".format(s_class, shard, extension)
+
+
+def existing_files(s_class: str, extension: str) -> List[str]:
+    """ Return the files of s_class with extension, sharded or not
+    """
+    pattern = re.compile(r"\.db_{}(\.\d+)?\.{}$".format(
+        re.escape(s_class), re.escape(extension)))
+    return sorted(p for p in glob.glob(".db_{}*.{}".format(
+        glob.escape(s_class), extension)) if pattern.match(p))
+
+
+def foreign_files(s_class: str, shards: int) -> List[str]:
+    """ Return the snapshot files and journals of s_class split in
+    another number of shards than shards
+    """
+    extensions = list(snapshot.EXTENSIONS.values())
+    foreign = []
+    for extension in extensions + ["journal", "journal.old"]:
+        expected = {file_path(s_class, extension, shards, shard)
+                    for shard in range(shards)}
+        foreign.extend(p for p in existing_files(s_class, extension)
+                       if p not in expected)
+    return foreign
+
+
+def load_file(path: str) -> list:
+    """ Return the (id, raw record) of a snapshot file, run by the
+    workers of the parallel load
+    """
+    return list(snapshot.load(path))
+
+
+def stored_files(s_class: str) -> Tuple[List[str], List[str]]:
+    """ Return the snapshot files and the journals (a .old journal
+    being listed under the name of the journal) of s_class, whatever
+    their sharding and format
+    """
+    sources = [path for ext in snapshot.EXTENSIONS.values()
+               for path in existing_files(s_class, ext)]
+    journals = sorted(set(existing_files(s_class, "journal")) | set(
+        path[:-len(".old")]
+        for path in existing_files(s_class, "journal.old")))
+    return sources, journals
+
+
+def read_objects(s_class: str) -> Dict[str, tuple]:
+    """ Return the raw record of every object of s_class in its
+    snapshot files, with its journals replayed, whatever their sharding
+    and format
+    """
+    sources, journals = stored_files(s_class)
+    objs = {}
+    for path in sources:
+        for obj_id, raw in snapshot.load(path):
+            objs[obj_id] = raw
+    for path in journals:
+        for op, obj_id, obj_json in Journal(path).replay():
+            if op == 'save':
+                objs[obj_id] = to_raw(obj_json)
+            else:
+                objs.pop(obj_id, None)
+    return objs
+
+
+def reshard(s_class: str, shards: int,
+            snapshot_format: str = 'json') -> Dict[str, int]:
+    """ Rewrite the snapshot files and journals of s_class, whatever
+    their current sharding, as shards snapshot files
+    Return:
+        number of objects per file written
+    """
+    extension = snapshot.EXTENSIONS[snapshot_format]
+    sources, journals = stored_files(s_class)
+    objs = read_objects(s_class)
+
+    split = [{} for _ in range(shards)]
+    for obj_id, raw in objs.items():
+        split[shard_of(obj_id, shards)][obj_id] = raw
+    written = {}
+    for shard, shard_objs in enumerate(split):
+        path = file_path(s_class, extension, shards, shard)
+        write_atomic(path, snapshot.dumps(shard_objs, snapshot_format))
+        written[path] = len(shard_objs)
+    for path in sources:
+        if path not in written:
+            os.remove(path)
+    for path in journals:
+        for journal_path in (path, path + ".old"):
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+    return written
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+""" SQLite storage module: Base objects kept in an SQLite database
+"""
+import calendar
+import sqlite3
+import threading
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterator, List, Tuple, TypeVar
+
+from models import shards
+from models.columns import Columns, categorize
+from models.lazy_store import raw_to_json
+from models.query import SQL_OPERATORS, matches, prefix_end, sort_key
+from models.storage import Storage
+
+
+SQL_TYPES = (str, int, float, bytes)
+TIMESTAMP_COLUMNS = ('created_at', 'updated_at')
+BUSY_TIMEOUT = 5.0
+FETCH_SIZE = 500
+
+
+def quote(name: str) -> str:
+    """ Quote an SQL identifier
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class SQLiteStorage(Storage):
+    """ One table per class, one column per declared attribute (the
+    timestamps as epoch seconds) and an SQL index per indexed attribute,
+    so that nothing is kept in memory between calls. Each thread uses
+    its own connection. Attributes outside the declared ones (in
+    __dict__) are not stored
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, file_path: str):
+        """ Initialize a SQLiteStorage on the database file_path
+        """
+        self.file_path = file_path
+        self.local = threading.local()
+        self.table_columns = {}
+        self.lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Return the connection of the current thread
+        """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.file_path,
+                                         timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def table(self, cls) -> Tuple[str, ...]:
+        """ Create the table of cls and its indexes if needed, and
+        return its columns
+        """
+        columns = self.table_columns.get(cls.__name__)
+        if columns is not None:
+            return columns
+        with self.lock:
+            columns = cls.field_names()
+            table = quote(cls.__name__)
+            definitions = [
+                quote(column) + (" TEXT PRIMARY KEY" if column == 'id' else
+                                 " INTEGER" if column in TIMESTAMP_COLUMNS
+                                 else "")
+                for column in columns]
+            connection = self.connection()
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS {} ({})".format(
+                    table, ", ".join(definitions)))
+                existing = [row[1] for row in connection.execute(
+                    "PRAGMA table_info({})".format(table))]
+                for column in columns:
+                    if column not in existing:
+                        connection.execute(
+                            "ALTER TABLE {} ADD COLUMN {}".format(
+                                table, quote(column)))
+                for attribute in cls.INDEXED_ATTRIBUTES:
+                    connection.execute(
+                        "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                            quote("{}_{}".format(cls.__name__, attribute)),
+                            table, quote(attribute)))
+            self.table_columns[cls.__name__] = columns
+        return columns
+
+    def _objects(self, cls, columns: tuple, rows: list) -> list:
+        """ Build the objects of rows
+        """
+        return cls.from_records([dict(zip(columns, row)) for row in rows])
+
+    def load(self, cls, progress: Callable = None):
+        """ Create the table of cls, nothing is loaded in memory. An
+        empty table is first filled with the objects of the snapshot
+        files and journals of the memory backend, if any (they are left
+        untouched)
+        """
+        columns = self.table(cls)
+        connection = self.connection()
+        if connection.execute("SELECT 1 FROM {} LIMIT 1".format(
+                quote(cls.__name__))).fetchone() is not None:
+            return
+        objs = shards.read_objects(cls.__name__)
+        if not objs:
+            return
+        records = cls.from_records(raw_to_json(raw) for raw in objs.values())
+        with connection:
+            connection.executemany(self._insert(cls, columns),
+                                   [self._values(obj, columns)
+                                    for obj in records])
+
+    def _insert(self, cls, columns: tuple) -> str:
+        """ Return the statement inserting or replacing a row of cls
+        """
+        return "INSERT OR REPLACE INTO {} ({}) VALUES ({})".format(
+            quote(cls.__name__),
+            ", ".join(quote(column) for column in columns),
+            ", ".join("?" for _ in columns))
+
+    def _values(self, obj: TypeVar('Base'), columns: tuple) -> list:
+        """ Return the values of the columns of obj
+        """
+        return [getattr(obj, '_' + column, None)
+                if column in TIMESTAMP_COLUMNS
+                else getattr(obj, column, None) for column in columns]
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or replace the row of obj
+        """
+        columns = self.table(obj.__class__)
+        connection = self.connection()
+        with connection:
+            connection.execute(self._insert(obj.__class__, columns),
+                               self._values(obj, columns))
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete the row of obj
+        """
+        self.table(obj.__class__)
+        connection = self.connection()
+        with connection:
+            connection.execute("DELETE FROM {} WHERE id = ?".format(
+                quote(obj.__class__.__name__)), (obj.id,))
+
+    def get(self, cls, obj_id: str) -> TypeVar('Base'):
+        """ Return the object of cls with obj_id, or None
+        """
+        columns = self.table(cls)
+        rows = self.connection().execute(
+            "SELECT {} FROM {} WHERE id = ?".format(
+                ", ".join(quote(column) for column in columns),
+                quote(cls.__name__)), (obj_id,)).fetchall()
+        objs = self._objects(cls, columns, rows)
+        return objs[0] if objs else None
+
+    def search(self, cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search through an SQL WHERE clause on the attributes stored
+        in columns, the others being compared on the objects found
+        """
+        columns = self.table(cls)
+        clauses = []
+        params = []
+        others = {}
+        for k, v in attributes.items():
+            if isinstance(v, datetime) and k in TIMESTAMP_COLUMNS:
+                v = calendar.timegm(v.timetuple())
+            if k not in columns or \
+                    (v is not None and type(v) not in SQL_TYPES):
+                others[k] = v
+            elif v is None:
+                clauses.append("{} IS NULL".format(quote(k)))
+            else:
+                clauses.append("{} = ?".format(quote(k)))
+                params.append(v)
+        sql = "SELECT {} FROM {}".format(
+            ", ".join(quote(column) for column in columns),
+            quote(cls.__name__))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        rows = self.connection().execute(sql, params).fetchall()
+        objs = self._objects(cls, columns, rows)
+        if not others:
+            return objs
+        return [obj for obj in objs
+                if all(getattr(obj, k) == v for k, v in others.items())]
+
+    def query(self, cls, conditions: list, order_by: str = None,
+              limit: int = None, offset: int = 0) -> Iterator[TypeVar('Base')]:
+        """ Iterate over the objects of cls meeting conditions: they
+        become a WHERE clause (a prefix being a range on the column),
+        order_by an ORDER BY and limit/offset a LIMIT unless some
+        conditions can only be tested on the objects. Rows are fetched
+        FETCH_SIZE at a time
+        """
+        columns = self.table(cls)
+        clauses = []
+        params = []
+        others = []
+        for condition in conditions:
+            attribute, op, value = condition
+            column = quote(attribute)
+            if attribute not in columns or \
+                    (value is not None and type(value) not in SQL_TYPES):
+                others.append(condition)
+            elif value is None:
+                clauses.append("{} IS NULL".format(column)
+                               if op == 'eq' else "0")
+            elif op == 'startswith':
+                clauses.append("{} >= ?".format(column))
+                params.append(value)
+                end = prefix_end(value)
+                if end is not None:
+                    clauses.append("{} < ?".format(column))
+                    params.append(end)
+            else:
+                clauses.append("{} {} ?".format(column, SQL_OPERATORS[op]))
+                params.append(value)
+        sql = "SELECT {} FROM {}".format(
+            ", ".join(quote(column) for column in columns),
+            quote(cls.__name__))
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        descending = order_by is not None and order_by[0] == '-'
+        order_attribute = order_by.lstrip('-') if order_by else None
+        sorted_in_sql = order_attribute is None or order_attribute in columns
+        if order_attribute is not None and sorted_in_sql:
+            sql += " ORDER BY {}{}".format(quote(order_attribute),
+                                           " DESC" if descending else "")
+        paged_in_sql = sorted_in_sql and not others
+        if paged_in_sql and (limit is not None or offset):
+            sql += " LIMIT ? OFFSET ?"
+            params += [-1 if limit is None else limit, offset]
+
+        def _objects():
+            cursor = self.connection().execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    return
+                for obj in self._objects(cls, columns, rows):
+                    if not others or matches(obj, others):
+                        yield obj
+
+        objs = _objects()
+        if not sorted_in_sql:
+            objs = iter(sorted(objs, key=sort_key(order_attribute),
+                               reverse=descending))
+        if paged_in_sql:
+            return objs
+        stop = None if limit is None else offset + limit
+        return islice(objs, offset, stop)
+
+    def columns(self, cls) -> Columns:
+        """ Build the column arrays of cls from the timestamps and
+        category attributes only, FETCH_SIZE rows at a time
+        """
+        columns = self.table(cls)
+        attributes = [attribute for attribute, _ in
+                      cls.CATEGORY_COLUMNS.values() if attribute in columns]
+        selected = ['id', 'created_at', 'updated_at'] + attributes
+        result = Columns(tuple(cls.CATEGORY_COLUMNS))
+        cursor = self.connection().execute("SELECT {} FROM {}".format(
+            ", ".join(quote(column) for column in selected),
+            quote(cls.__name__)))
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return result
+            for row in rows:
+                values = dict(zip(attributes, row[3:]))
+                result.set(row[0], row[1], row[2], categorize(
+                    cls.CATEGORY_COLUMNS, values.get))
+
+    def count(self, cls) -> int:
+        """ Return the number of rows of cls, through COUNT(*)
+        """
+        self.table(cls)
+        return self.connection().execute("SELECT COUNT(*) FROM {}".format(
+            quote(cls.__name__))).fetchone()[0]
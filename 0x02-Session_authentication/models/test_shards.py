@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+""" Tests of the sharded storage files
+"""
+import glob
+import unittest
+
+from models import shards, snapshot
+from models.test_base import StoreTestCase
+from models.user import User
+
+
+class TestReshard(StoreTestCase):
+    """ Files of a class rewritten in another number of shards
+    """
+
+    def setUp(self):
+        """ Save users in one snapshot file, then change some of them
+        in a journal
+        """
+        super().setUp()
+        User.load_from_file()
+        self.users = self.make_users(40)
+        self.configure(STORAGE_MODE='journal')
+        self.users[0].remove()
+        self.users[1].first_name = "Journaled"
+        self.users[1].save()
+        self.close()
+        self.ids = sorted(user.id for user in self.users[1:])
+
+    def test_foreign_shards_refused(self):
+        """ Files split in another number of shards are never ignored
+        """
+        self.configure(SHARD_COUNT=4)
+        with self.assertRaises(ValueError) as context:
+            self.restart()
+        self.assertIn("reshard.py User 4", str(context.exception))
+
+    def test_reshard(self):
+        """ Every object, journal included, lands in the file of its
+        shard and loads with BASE_SHARDS set to the new count
+        """
+        written = shards.reshard('User', 4)
+        self.assertEqual(sorted(written), [".db_User.{}.json".format(i)
+                                           for i in range(4)])
+        self.assertEqual(sum(written.values()), 39)
+        self.assertEqual(sorted(glob.glob(".db_User*")), sorted(written))
+        for shard in range(4):
+            path = ".db_User.{}.json".format(shard)
+            for obj_id, _ in snapshot.load(path):
+                self.assertEqual(shards.shard_of(obj_id, 4), shard)
+        self.configure(SHARD_COUNT=4)
+        self.restart()
+        self.assertEqual(sorted(user.id for user in User.all()), self.ids)
+        self.assertEqual(User.get(self.users[1].id).first_name, "Journaled")
+        self.assertEqual(User.search({'email': "u005@x.io"}),
+                         [self.users[5]])
+
+    def test_reshard_back(self):
+        """ Shards go back to a single file, in another format
+        """
+        shards.reshard('User', 3)
+        written = shards.reshard('User', 1, 'binary')
+        self.assertEqual(written, {".db_User.bin": 39})
+        self.assertEqual(glob.glob(".db_User*"), [".db_User.bin"])
+        self.configure(SNAPSHOT_FORMAT='binary')
+        self.restart()
+        self.assertEqual(sorted(user.id for user in User.all()), self.ids)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+""" Tests of the snapshot formats
+"""
+import json
+import os
+import unittest
+
+from models import snapshot
+from models.lazy_store import raw_to_json
+from models.test_base import StoreTestCase
+from models.user import User
+
+
+class TestConvert(StoreTestCase):
+    """ Snapshots converted between the JSON and binary formats
+    """
+
+    def setUp(self):
+        """ Write a JSON snapshot of users, one of them with an
+        attribute outside of the declared ones
+        """
+        super().setUp()
+        User.load_from_file()
+        self.users = self.make_users(20)
+        self.users[0].password = "secret"
+        self.users[0].nickname = "zero"
+        self.users[0].save()
+        with open(".db_User.json") as f:
+            self.objs = json.load(f)
+
+    def loaded(self, file_path: str) -> dict:
+        """ Return the JSON dictionaries of a snapshot file by id
+        """
+        return {obj_id: raw_to_json(raw)
+                for obj_id, raw in snapshot.load(file_path)}
+
+    def test_round_trip(self):
+        """ JSON to binary to JSON keeps every object and attribute
+        """
+        count = snapshot.convert(".db_User.json", "users.bin", 'binary')
+        self.assertEqual(count, 20)
+        self.assertEqual(snapshot.file_format("users.bin"), 'binary')
+        self.assertEqual(snapshot.convert("users.bin", "users.json", 'json'),
+                         20)
+        self.assertEqual(snapshot.file_format("users.json"), 'json')
+        with open("users.json") as f:
+            self.assertEqual(json.load(f), self.objs)
+        self.assertEqual(self.loaded("users.json"),
+                         self.loaded(".db_User.json"))
+
+    def test_load_converted(self):
+        """ A converted snapshot loads in the binary format
+        """
+        snapshot.convert(".db_User.json", ".db_User.bin", 'binary')
+        os.remove(".db_User.json")
+        self.configure(SNAPSHOT_FORMAT='binary')
+        self.restart()
+        self.assertEqual(User.count(), 20)
+        user = User.get(self.users[0].id)
+        self.assertTrue(user.is_valid_password("secret"))
+        self.assertEqual(user.created_at, self.users[0].created_at)
+        self.assertEqual(User.search({'email': "u007@x.io"}),
+                         [self.users[7]])
+
+    def test_other_format_refused(self):
+        """ A snapshot left in the other format is never ignored
+        """
+        self.configure(SNAPSHOT_FORMAT='binary')
+        with self.assertRaises(ValueError):
+            self.restart()
+
+
+if __name__ == '__main__':
+    unittest.main()
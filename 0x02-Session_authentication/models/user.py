@@ -5,10 +5,29 @@ import hashlib
 from models.base import Base
 
 
+def email_domain(email: str) -> str:
+    """ Return the domain of an email address, lowercased, or None
+    when there is no @ (the value is not an address: it must not be
+    published as a domain)
+    """
+    if '@' not in email:
+        return None
+    return email.rpartition('@')[2].lower() or None
+
+
 class User(Base):
     """ User class
     """
 
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+    INDEXED_ATTRIBUTES = ('email',)
+    SORTED_ATTRIBUTES = ('created_at', 'updated_at', 'email')
+    CATEGORY_COLUMNS = {
+        'email_domain': ('email', email_domain),
+        'first_name': ('first_name', None),
+        'last_name': ('last_name', None),
+    }
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+""" Writer module: atomic file writes and deferred, coalesced saves
+"""
+import os
+import threading
+import time
+from typing import Callable
+
+
+FSYNC_POLICIES = ('none', 'file', 'directory')
+
+
+def write_atomic(file_path: str, content, fsync: str = 'none') -> int:
+    """ Write content to a temporary file then move it over file_path
+    Parameters:
+        file_path: destination file
+        content: text or bytes to write
+        fsync: 'none', 'file' (fsync the file before the move) or
+            'directory' (also fsync the directory after the move)
+    Return:
+        number of bytes written
+    """
+    # forked workers share the thread ident of their parent: the pid
+    # keeps their temporary files apart
+    tmp_path = "{}.{}.{}.tmp".format(file_path, os.getpid(),
+                                     threading.get_ident())
+    data = content if type(content) is bytes else content.encode('utf-8')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        if fsync != 'none':
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+    if fsync == 'directory':
+        fd = os.open(os.path.dirname(os.path.abspath(file_path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    return len(data)
+
+
+class DeferredWriter():
+    """ Background writer coalescing the saves of each class: a dirty
+    class is written at most once per interval, or as soon as
+    max_changes changes are pending
+    """
+
+    def __init__(self, write: Callable, interval: float = 1.0,
+                 max_changes: int = 100):
+        """ Initialize a DeferredWriter
+        Parameters:
+            write: called with a class to persist all its objects
+            interval: seconds between the first pending change and the write
+            max_changes: number of pending changes forcing a write
+        """
+        self.write = write
+        self.interval = interval
+        self.max_changes = max_changes
+        self.dirty = {}
+        self.changes = 0
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock()
+        self.stopping = False
+        self.thread = None
+        self.stats = {'changes': 0, 'flushes': 0}
+
+    def mark(self, cls):
+        """ Record one change of cls, to be written later
+        """
+        with self.condition:
+            self.dirty[cls.__name__] = cls
+            self.changes += 1
+            self.stats['changes'] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            if self.changes >= self.max_changes:
+                self.condition.notify()
+
+    def _take(self, cls=None) -> list:
+        """ Remove and return the dirty classes (only cls if given),
+        must be called with the condition held
+        """
+        if cls is None:
+            batch = list(self.dirty.values())
+            self.dirty = {}
+            self.changes = 0
+        elif self.dirty.pop(cls.__name__, None) is not None:
+            batch = [cls]
+            if not self.dirty:
+                self.changes = 0
+        else:
+            batch = []
+        return batch
+
+    def _write(self, batch: list):
+        """ Persist every class of batch, one writer at a time so that
+        files are written in the order their content was taken
+        """
+        with self.write_lock:
+            for cls in batch:
+                self.write(cls)
+                self.stats['flushes'] += 1
+
+    def _run(self):
+        """ Background loop
+        """
+        while True:
+            with self.condition:
+                while not self.dirty and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                deadline = time.monotonic() + self.interval
+                while not self.stopping and \
+                        self.changes < self.max_changes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch = self._take()
+            self._write(batch)
+
+    def flush(self, cls=None):
+        """ Write the pending changes now (of cls only if given)
+        """
+        with self.condition:
+            batch = self._take(cls)
+        self._write(batch)
+
+    def stop(self):
+        """ Write every pending change and stop the background thread
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+""" Split the snapshot files and journals of a models class in shards
+"""
+import argparse
+
+from models.shards import reshard
+from models.snapshot import SNAPSHOT_FORMATS
+
+
+def main():
+    """ Command line entry point
+    """
+    parser = argparse.ArgumentParser(
+        description="Rewrite the .db_<Class> files of the current "
+                    "directory, sharded or not, as a number of shards")
+    parser.add_argument("class_name", help="class name, for example User")
+    parser.add_argument("shards", type=int, help="number of shards, "
+                        "the value of BASE_SHARDS to run with")
+    parser.add_argument("-f", "--format", choices=SNAPSHOT_FORMATS,
+                        default="json", help="format of the shard files")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("shards must be at least 1")
+    for path, count in reshard(args.class_name, args.shards,
+                               args.format).items():
+        print("{}: {} objects".format(path, count))
+
+
+if __name__ == "__main__":
+    main()